@@ -342,7 +342,8 @@ class Activity:
 
     @staticmethod
     def from_file(fpath: str, config: Config, activity_id: int, activity_name: str = None,
-                  activity_description: str = None, activity_type: str = None) -> 'Activity':
+                  activity_description: str = None, activity_type: str = None,
+                  move_source: bool = False) -> 'Activity':
         """
         Create a new Activity object from a file containing activity
         data.
@@ -355,6 +356,8 @@ class Activity:
         Optional.
         :param activity_type: The type of the activity. Must be one of the supported activity types. Optional; if not\
         provided, the default activity type will be used.
+        :param move_source: If True, move the file to the source file directory (rather than copying it). Useful for\
+        temporary files, such as uploads.
         :return: The new Activity object.
 
         """
@@ -388,8 +391,13 @@ class Activity:
             raise e
         source_file = os.path.join(config.source_file_dir, f'{activity.metadata.file_name}{ext}')
         if not os.path.exists(source_file):
-            logger.info(f'Copying source file to "{source_file}".')
-            shutil.copyfile(fpath, source_file)
+            if move_source:
+                # A rename (with no copying) if the file is on the same filesystem
+                logger.info(f'Moving source file to "{source_file}".')
+                shutil.move(fpath, source_file)
+            else:
+                logger.info(f'Copying source file to "{source_file}".')
+                shutil.copyfile(fpath, source_file)
         activity.metadata.source_file = source_file
         return activity
 
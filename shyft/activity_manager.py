@@ -1,7 +1,10 @@
 import calendar
+import copy
 import os
+import threading
+from collections import OrderedDict
 from datetime import date, timedelta, datetime
-from typing import Tuple, Sequence, Optional, Dict, List, Generator, Union, Callable, Any, Collection, Set
+from typing import Tuple, Sequence, Optional, Dict, List, Generator, Union, Callable, Any, Collection, Set, Iterable
 
 import pandas as pd
 from dateutil.relativedelta import relativedelta
@@ -24,14 +27,37 @@ def _iter_dates(start: date, end_inclusive: date,
         current += step
 
 
+def _data_files(metadata: ActivityMetaData, gpx_file: bool, tcx_file: bool, source_file: bool) -> List[str]:
+    """Return the paths to the (selected) files associated with an
+    activity.
+    """
+    return [fpath for include, fpath in (
+        (gpx_file, metadata.gpx_file),
+        (tcx_file, metadata.tcx_file),
+        (source_file, metadata.source_file)
+    ) if include and (fpath is not None)]
+
+
+def _remove_if_exists(fpath: str):
+    if os.path.exists(fpath):
+        os.remove(fpath)
+
+
 class ActivityManager:
 
+    # The maximum number of activities' metadata to keep in the metadata cache.
+    MAX_CACHED_METADATA = 1024
+
     def __init__(self, config: Config):
         self.config = config
-        if not os.path.exists(config.data_dir):
-            os.makedirs(config.data_dir)
+        os.makedirs(config.data_dir, exist_ok=True)
         self.dbm = DatabaseManager(config)
         self._cache: Dict[int, Activity] = {}
+        # Metadata for activities which have been looked up but are not (necessarily) in the activity cache, least
+        # recently used first.
+        self._metadata_cache: 'OrderedDict[int, ActivityMetaData]' = OrderedDict()
+        # Dash may handle requests in several threads, so guard the metadata cache's (non-atomic) updates.
+        self._metadata_lock = threading.Lock()
 
     @property
     def activity_ids(self):
@@ -74,39 +100,101 @@ class ActivityManager:
                 return None
 
     def get_metadata_by_id(self, activity_id: int) -> Optional[ActivityMetaData]:
-        if activity_id in self._cache:
-            return self._cache[activity_id].metadata
+        activity = self._cache.get(activity_id)
+        if activity is not None:
+            metadata = activity.metadata
         else:
-            try:
-                return ActivityMetaData(self.config, **self.dbm.load_metadata(activity_id))
-            except ValueError:
-                return None
+            with self._metadata_lock:
+                metadata = self._metadata_cache.get(activity_id)
+                if metadata is not None:
+                    self._metadata_cache.move_to_end(activity_id)
+            if metadata is None:
+                try:
+                    metadata = ActivityMetaData(self.config, **self.dbm.load_metadata(activity_id))
+                except ValueError:
+                    return None
+                with self._metadata_lock:
+                    self._metadata_cache[activity_id] = metadata
+                    if len(self._metadata_cache) > self.MAX_CACHED_METADATA:
+                        self._metadata_cache.popitem(last=False)
+        # Always return a copy, so that changes made by the caller don't affect the cached metadata (or activity).
+        return copy.copy(metadata)
+
+    def _uncache_metadata(self, activity_id: int):
+        """Remove an activity's metadata from the metadata cache, if it
+        is there.
+        """
+        with self._metadata_lock:
+            self._metadata_cache.pop(activity_id, None)
 
     def get_new_activity_id(self) -> int:
         return self.dbm.max_activity_id + 1
 
-    def add_activity(self, activity: Activity, cache: bool = True) -> int:
+    def add_activity(self, activity: Activity, cache: bool = True, commit: bool = True) -> int:
         """Add an Activity instance, including finding and assigning its
         matched prototype Activity. Does not assign activity_id. The
         Activity should be instantiated correctly (including with an
         activity_id) before being passed to this method.
         """
         if activity.metadata.prototype_id is None:
-            activity.metadata.prototype_id = self.find_route_match(activity)
-        self.save_activity_to_db(activity)
+            activity.metadata.prototype_id = self.find_route_match(activity, commit=commit)
+        self.save_activity_to_db(activity, commit=commit)
         _id = activity.metadata.activity_id
         if cache:
             self._cache[_id] = activity
         return _id
 
+    def add_activities(self, activities: Iterable[Activity], cache: bool = True) -> List[int]:
+        """Add several Activity instances (in order) as if by calling
+        `add_activity` on each, but commit to the database only once at
+        the end rather than once per activity.
+
+        If adding any of the activities fails, none of them are added:
+        the transaction is rolled back (so any other uncommitted changes
+        are also discarded), the activities' prototype IDs are restored
+        and the exception is re-raised.
+        """
+        # Each activity, with the prototype ID it had before it was added.
+        added = []
+        try:
+            for a in activities:
+                # Note the activity first, so that a partially added activity is also restored on failure.
+                added.append((a, a.metadata.prototype_id))
+                self.add_activity(a, cache=cache, commit=False)
+            self.dbm.commit()
+        except Exception:
+            self.dbm.rollback()
+            for a, prototype_id in added:
+                # add_activity may have assigned a prototype which, after the rollback, doesn't exist.
+                a.metadata.prototype_id = prototype_id
+                self._cache.pop(a.metadata.activity_id, None)
+                self._uncache_metadata(a.metadata.activity_id)
+            raise
+        return [a.metadata.activity_id for a, _ in added]
+
     def add_activity_from_file(self, fpath: str, activity_name: str = None,
-                               activity_description: str = None, activity_type: str = None) -> int:
+                               activity_description: str = None, activity_type: str = None,
+                               move_source: bool = False) -> int:
         _id = self.get_new_activity_id()
         return self.add_activity(
             Activity.from_file(fpath, self.config, activity_id=_id, activity_name=activity_name,
-                               activity_description=activity_description, activity_type=activity_type)
+                               activity_description=activity_description, activity_type=activity_type,
+                               move_source=move_source)
         )
 
+    def add_activities_from_files(self, fpaths: Sequence[str]) -> List[int]:
+        """Add activities from several files (in order) as if by calling
+        `add_activity_from_file` on each, but commit to the database only
+        once.
+
+        All the files are parsed before any activity is added, so if any
+        of them can't be parsed, none of them are added.
+        """
+        first_id = self.get_new_activity_id()
+        activities = [Activity.from_file(fpath, self.config, activity_id=_id)
+                      for _id, fpath in enumerate(fpaths, first_id)]
+        return self.add_activities(activities)
+
     def loose_match_routes(self, a1: Activity, a2: Activity) -> bool:
         return (
                 (norm_center_diff(a1.metadata.center, a2.metadata.center, a1.metadata.points_std,
@@ -116,10 +204,11 @@ class ActivityManager:
         )
 
     def tight_match_routes(self, a1: Activity, a2: Activity) -> Tuple[bool, float]:
-        norm_distance = norm_dtw(a1.points[['latitude', 'longitude']], a2.points[['latitude', 'longitude']])
+        norm_distance = norm_dtw(a1.points[['latitude', 'longitude']].to_numpy(dtype=float),
+                                 a2.points[['latitude', 'longitude']].to_numpy(dtype=float))
         return (norm_distance < self.config.tight_match_threshold), norm_distance
 
-    def find_route_match(self, a: Activity) -> int:
+    def find_route_match(self, a: Activity, commit: bool = True) -> int:
         prototypes = (self.get_activity_by_id(i) for i in self.prototypes)
         # First, find loose matches
         loose_matches = filter(lambda p: self.loose_match_routes(p, a), prototypes)
@@ -130,7 +219,7 @@ class ActivityManager:
                 tight_matches.append((p.metadata.activity_id, dist))
         if not tight_matches:
             # No matches; make this _activity_elem a prototype
-            self.dbm.save_prototype(a.metadata.activity_id)
+            self.dbm.save_prototype(a.metadata.activity_id, commit=commit)
             return a.metadata.activity_id
         elif len(tight_matches) == 1:
             return tight_matches[0][0]
@@ -158,11 +247,15 @@ class ActivityManager:
         metadata = self.search_metadata(from_date, to_date, prototype, activity_type, number)
         return summarize_metadata(metadata)
 
-    def save_activity_to_db(self, activity: Activity):
-        self.dbm.save_metadata(activity.metadata)
-        self.dbm.save_dataframe('points', activity.points, activity.metadata.activity_id)
+    def save_activity_to_db(self, activity: Activity, commit: bool = True):
+        self._uncache_metadata(activity.metadata.activity_id)
+        self.dbm.save_metadata(activity.metadata, commit=False)
+        self.dbm.save_dataframe('points', activity.points, activity.metadata.activity_id, commit=False)
         if activity.laps is not None:
-            self.dbm.save_dataframe('laps', activity.laps, activity.metadata.activity_id, index_label='lap_no')
+            self.dbm.save_dataframe('laps', activity.laps, activity.metadata.activity_id, commit=False,
+                                    index_label='lap_no')
+        if commit:
+            self.dbm.commit()
 
     def get_activity_matches(self, metadata: ActivityMetaData,
                              number: Optional[int] = None) -> List[ActivityMetaData]:
@@ -176,37 +269,68 @@ class ActivityManager:
             return results[:number]
 
     def delete_activity(self, activity_id: int, delete_gpx_file: bool = True, delete_tcx_file: bool = True,
-                        delete_source_file: bool = True):
+                        delete_source_file: bool = True, commit: bool = True):
+        metadata = self._delete_activity_from_db(activity_id, commit)
+        for fpath in _data_files(metadata, delete_gpx_file, delete_tcx_file, delete_source_file):
+            _remove_if_exists(fpath)
+        logger.info(f'Deleted activity with ID {metadata.activity_id}.')
+
+    def delete_activities(self, activity_ids: Iterable[int], delete_gpx_file: bool = True,
+                          delete_tcx_file: bool = True, delete_source_file: bool = True) -> List[int]:
+        """Delete several activities as if by calling `delete_activity` on
+        each, but commit to the database only once (deleting the
+        associated files afterwards).
+
+        Returns a list of the given IDs for which no activity was found
+        (which are otherwise ignored).
+        """
+        bad_ids = []
+        fpaths = []
+        for activity_id in activity_ids:
+            try:
+                metadata = self._delete_activity_from_db(activity_id, commit=False)
+            except ValueError:
+                bad_ids.append(activity_id)
+                continue
+            fpaths.extend(_data_files(metadata, delete_gpx_file, delete_tcx_file, delete_source_file))
+            logger.info(f'Deleted activity with ID {metadata.activity_id}.')
+        self.dbm.commit()
+        for fpath in fpaths:
+            _remove_if_exists(fpath)
+        return bad_ids
+
+    def _delete_activity_from_db(self, activity_id: int, commit: bool = True) -> ActivityMetaData:
+        """Delete an activity from the database (and the caches), choosing
+        a new prototype for its matches if necessary, and return its
+        metadata. Does not delete any associated files.
+        """
         metadata = self.get_metadata_by_id(activity_id)
         if metadata is None:
             raise ValueError(f'Bad _activity_elem ID: {activity_id}')
-        self.dbm.delete_activity(activity_id)
+        self.dbm.delete_activity(activity_id, commit=commit)
         if activity_id in self._cache:
             self._cache.pop(activity_id)
+        self._uncache_metadata(activity_id)
         if metadata.activity_id == metadata.prototype_id:
             matches = self.get_activity_matches(metadata)
             if matches:
                 next_match_id = matches[0].activity_id
-                self.replace_prototype(metadata.activity_id, next_match_id)
+                self.replace_prototype(metadata.activity_id, next_match_id, commit=commit)
             else:
-                self.dbm.delete_prototype(metadata.activity_id)
-        if delete_gpx_file and (metadata.gpx_file is not None) and os.path.exists(metadata.gpx_file):
-            os.remove(metadata.gpx_file)
-        if delete_tcx_file and (metadata.tcx_file is not None) and os.path.exists(metadata.tcx_file):
-            os.remove(metadata.tcx_file)
-        if delete_source_file and (metadata.source_file is not None) and os.path.exists(metadata.source_file):
-            os.remove(metadata.source_file)
-        logger.info(f'Deleted activity with ID {metadata.activity_id}.')
+                self.dbm.delete_prototype(metadata.activity_id, commit=commit)
+        return metadata
 
-    def replace_prototype(self, old_id: int, new_id: int):
+    def replace_prototype(self, old_id: int, new_id: int, commit: bool = True):
         matches = self.search_metadata(prototype=old_id)
         for metadata in matches:
             if metadata.activity_id in self._cache:
                 self._cache.pop(metadata.activity_id)
+            self._uncache_metadata(metadata.activity_id)
             metadata.prototype_id = new_id
             self.dbm.save_metadata(metadata, commit=False)
         self.dbm.change_prototype(old_id, new_id, commit=False)
-        self.dbm.commit()
+        if commit:
+            self.dbm.commit()
 
     def get_metadata_by_month(self, month: date, **kwargs) -> List[ActivityMetaData]:
         """
@@ -1,5 +1,6 @@
 import logging
 import os
+from operator import attrgetter
 from typing import Tuple
 from urllib.parse import urlparse
 
@@ -21,6 +22,15 @@ STYLESHEETS = [dbc.themes.SANDSTONE]
 
 CONTENT_DIR = os.path.join('app', 'content')
 
+# The maximum size of a request body that the app will accept (uploads are sent base64-encoded, so this allows for
+# activity files of around 75 MB).
+MAX_CONTENT_LENGTH = 100 * 1024 * 1024
+
+# Functions to get the relevant file paths from an ActivityMetaData object
+_GET_GPX_FILE = attrgetter('gpx_file')
+_GET_TCX_FILE = attrgetter('tcx_file')
+_GET_SOURCE_FILE = attrgetter('source_file')
+
 
 def get_apps(config: Config) -> Tuple[Flask, Dash]:
     """Initialise and return the Flask and Dash apps."""
@@ -34,6 +44,9 @@ def get_apps(config: Config) -> Tuple[Flask, Dash]:
     # same ID in normal usage.
     flask_app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 
+    # Reject overly large requests before their bodies are parsed.
+    flask_app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+
     dash_app = Dash(__name__, server=flask_app, external_stylesheets=STYLESHEETS, title='Shyft')
 
     controller = MainController(dash_app, config)
@@ -46,32 +59,34 @@ def get_apps(config: Config) -> Tuple[Flask, Dash]:
             return abort(404, description=f'Invalid activity ID specified: "{id}".')
         # print(f'Activity with ID {activity_id}: {am.get_metadata_by_id(activity_id)}')
         metadata = controller.activity_manager.get_metadata_by_id(activity_id)
-        return send_file(metadata.thumbnail_file, mimetype='image/png')
+        # Thumbnails are never cached without revalidation (see SEND_FILE_MAX_AGE_DEFAULT above), but a conditional
+        # response means a browser that already has an unchanged thumbnail just gets a 304 (with no body).
+        return send_file(metadata.thumbnail_file, mimetype='image/png', conditional=True)
 
     @flask_app.route('/gpx_files')
     def get_gpx_file():
-        logger.debug(f'gpx_files endpoint reached with GET params: "{request.args}".')
-        return controller.serve_files_from_get_params(request.args, lambda md: md.gpx_file,
+        logger.debug('gpx_files endpoint reached with GET params: "%s".', request.args)
+        return controller.serve_files_from_get_params(request.args, _GET_GPX_FILE,
                                                       f'{APP_NAME}_gpx_files.zip',
                                                       'No GPX files found for selected activities.')
 
     @flask_app.route('/tcx_files')
     def get_tcx_file():
-        logger.debug(f'tcx_files endpoint reached with GET params: "{request.args}".')
-        return controller.serve_files_from_get_params(request.args, lambda md: md.tcx_file,
+        logger.debug('tcx_files endpoint reached with GET params: "%s".', request.args)
+        return controller.serve_files_from_get_params(request.args, _GET_TCX_FILE,
                                                       f'{APP_NAME}_tcx_files.zip',
                                                       'No TCX files found for selected activities.')
 
     @flask_app.route('/source_files')
     def get_source_file():
-        logger.debug(f'source_files endpoint reached with GET params: "{request.args}".')
-        return controller.serve_files_from_get_params(request.args, lambda md: md.source_file,
+        logger.debug('source_files endpoint reached with GET params: "%s".', request.args)
+        return controller.serve_files_from_get_params(request.args, _GET_SOURCE_FILE,
                                                       f'{APP_NAME}_source_files.zip',
                                                       'No source files found for selected activities.')
 
     @flask_app.route('/delete', methods=['POST', 'GET'])
     def delete():
-        logger.debug(f'/delete endpoint reached with args: {request.form}')
+        logger.debug('/delete endpoint reached with args: %s', request.form)
         if not request.form:
             logger.warning('delete function received empty request.form. Not deleting anything.')
         else:
@@ -80,14 +95,11 @@ def get_apps(config: Config) -> Tuple[Flask, Dash]:
                                 controller.url_params_to_metadata(request.form)]
             except ValueError:
                 return abort(404, f'Bad query. Check logs for details.')
-            for i in activity_ids:
-                try:
-                    controller.activity_manager.delete_activity(i)
-                except ValueError:
-                    controller.msg_bus.add_message(
-                        f'Could not delete activity with ID {i}. It may not exist.',
-                        logging.ERROR
-                    )
+            for i in controller.activity_manager.delete_activities(activity_ids):
+                controller.msg_bus.add_message(
+                    f'Could not delete activity with ID {i}. It may not exist.',
+                    logging.ERROR
+                )
             if len(activity_ids) == 1:
                 controller.msg_bus.add_message(f'Deleted activity with ID {activity_ids[0]}.')
             else:
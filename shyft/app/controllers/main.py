@@ -5,7 +5,7 @@ from io import BytesIO
 from logging import ERROR
 from typing import List, Dict, Optional, Tuple, Callable
 from urllib.parse import urlparse, parse_qs
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_STORED
 
 import flask
 import dash
@@ -44,6 +44,8 @@ MIMETYPES = {
     '.tcx': 'application/vnd.garmin.tcx+xml'
 }
 MIMETYPE_FALLBACK = 'application/octet-stream'
+# (suffix, mimetype) pairs, for matching against file paths with str.endswith
+_MIMETYPE_SUFFIXES = tuple(MIMETYPES.items())
 
 
 class MainController:
@@ -337,8 +339,7 @@ class MainController:
         """A generic function to serve a file."""
 
         if fpath:
-            _, ext = os.path.splitext(fpath)
-            mimetype = MIMETYPES.get(ext, MIMETYPE_FALLBACK)
+            mimetype = next((m for suffix, m in _MIMETYPE_SUFFIXES if fpath.endswith(suffix)), MIMETYPE_FALLBACK)
             return flask.send_file(fpath, mimetype=mimetype, as_attachment=True,
                                    attachment_filename=os.path.basename(fpath))
         else:
@@ -349,7 +350,8 @@ class MainController:
         """A generic function to serve multiple files as a zip archive."""
         zip_bytes = BytesIO()
         try:
-            with ZipFile(zip_bytes, mode='w') as z:
+            # The files are stored in the archive uncompressed.
+            with ZipFile(zip_bytes, mode='w', compression=ZIP_STORED) as z:
                 for f in fpaths:
                     logger.debug(f'Adding {f} to zip archive.')
                     z.write(f, os.path.basename(f))
@@ -81,8 +81,7 @@ class UploadController(_BaseDashController):
 
     def parse_contents(self, contents: str, fname: str) -> Optional[int]:
         tmp_dir = os.path.join(self.config.data_dir, 'tmp')
-        if not os.path.exists(tmp_dir):
-            os.makedirs(tmp_dir)
+        os.makedirs(tmp_dir, exist_ok=True)
         logger.info(f'Received uploaded file "{fname}".')
         content_type, content_string = contents.split(',')
         tmp_fpath = os.path.join(tmp_dir, secure_filename(fname))
@@ -90,7 +89,8 @@ class UploadController(_BaseDashController):
             logger.info(f'Saving file to "{tmp_fpath}".')
             f.write(base64.b64decode(content_string))
         try:
-            id = self.activity_manager.add_activity_from_file(tmp_fpath)
+            # The uploaded file is only needed as the activity's source file, so move it there rather than copying it.
+            id = self.activity_manager.add_activity_from_file(tmp_fpath, move_source=True)
             logger.info(f'Added new activity with ID {id}.')
             self.msg_bus.add_message(f'Uploaded new activity from file {fname}.')
             return id
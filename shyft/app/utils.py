@@ -1,16 +1,25 @@
+import re
 from typing import List
 
+# A single activity ID.
+_ID_RE = re.compile(r'-?\d+')
+# Separates the IDs in a string of comma-separated IDs (allowing whitespace around the commas).
+_ID_SEP_RE = re.compile(r'\s*,\s*')
+# A whole string of comma-separated IDs.
+_ID_LIST_RE = re.compile(r'-?\d+(?:\s*,\s*-?\d+)*')
+
 
 def id_str_to_ints(id_str: str) -> List[int]:
     """Convert a string containing comma-separated activity IDs to a
     list of integers, performing some basic verification and raising a
     ValueError if one of the given IDs is not valid.
     """
-    id_list = id_str.split(',')
-    int_ids = []
-    for i in id_list:
-        try:
-            int_ids.append(int(i))
-        except (ValueError, TypeError):
+    id_str = id_str.strip()
+    if _ID_LIST_RE.fullmatch(id_str):
+        return list(map(int, _ID_SEP_RE.split(id_str)))
+    # Find the first bad ID, so we can report it.
+    for i in _ID_SEP_RE.split(id_str):
+        if not _ID_RE.fullmatch(i):
             raise ValueError(f'Bad activity id: "{i}".')
-    return int_ids
\ No newline at end of file
+    # Should not be reached, but never fall through and return None if the patterns above ever disagree.
+    raise ValueError(f'Bad activity ids: "{id_str}".')
@@ -19,6 +19,13 @@ from shyft.metadata import APP_NAME, VERSION, URL
 
 logger = get_logger(__name__)
 
+# The data displayed in the footer, which doesn't change once the app is running.
+_FOOTER_DATA = {
+    'app_name': APP_NAME,
+    'app_version': VERSION,
+    'app_url': URL
+}
+
 
 class BaseDashComponentFactory:
     """A base for classes that generate Dash various components
@@ -241,11 +248,8 @@ class BaseDashComponentFactory:
         return html.Title(f'{page_title} - {APP_NAME}')
 
     def _get_footer_data(self) -> Dict[str, Any]:
-        return {
-            'app_name': APP_NAME,
-            'app_version': VERSION,
-            'app_url': URL
-        }
+        # Return a copy, so that callers can't change what is shown in every footer.
+        return dict(_FOOTER_DATA)
 
     def footer(self) -> html.Footer:
         """Return a footer element to be displayed at the bottom of
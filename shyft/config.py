@@ -120,8 +120,7 @@ class Config:
 
         for _dir in (self.data_dir, self.thumbnail_dir, self.gpx_file_dir, self.tcx_file_dir, self.source_file_dir,
                      self.user_docs_dir, self.tmp_dir):
-            if not os.path.exists(_dir):
-                os.makedirs(_dir)
+            os.makedirs(_dir, exist_ok=True)
 
     @property
     def week_start(self) -> str:
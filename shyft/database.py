@@ -162,6 +162,12 @@ class DatabaseManager:
         PRIMARY KEY(activity_id, lap_no)
     )"""
 
+    # Indexes for the columns activities are most often searched by.
+    INDEXES = (
+        'CREATE INDEX IF NOT EXISTS "idx_activities_prototype_id" ON "activities" (prototype_id)',
+        'CREATE INDEX IF NOT EXISTS "idx_activities_date_time_type" ON "activities" (date_time, activity_type)'
+    )
+
     SAVE_ACTIVITY_DATA = """INSERT OR REPLACE INTO \"activities\"
         (activity_id, activity_type, date_time, distance_2d_km, center_lat, center_lon, center_elev, std_lat, std_lon,
         std_elev, duration, mean_kmph, prototype_id, name, description, thumbnail_file, gpx_file, tcx_file,
@@ -200,11 +206,16 @@ class DatabaseManager:
     def commit(self):
         self.connection.commit()
 
+    def rollback(self):
+        self.connection.rollback()
+
     def create_tables(self, commit: bool = True):
         self.sql_execute(self.ACTIVITIES)
         self.sql_execute(self.POINTS)
         self.sql_execute(self.LAPS)
         self.sql_execute(self.PROTOTYPES)
+        for index in self.INDEXES:
+            self.sql_execute(index)
         if commit:
             self.commit()
 
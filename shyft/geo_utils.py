@@ -91,6 +91,16 @@ def norm_length_diff(len_1: float, len_2: float) -> float:
     return abs(len_1 - len_2) / ((len_1 + len_2) / 2)
 
 
+def pairwise_norm_length_diff(lengths: np.ndarray) -> np.ndarray:
+    """Vectorised version of `norm_length_diff`. Given an array of N
+    lengths, return an (N, N) array whose [i, j]th element is the
+    normalised difference between the ith and jth lengths.
+    """
+    lengths = np.asarray(lengths, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return norm_length_diff(lengths[:, np.newaxis], lengths[np.newaxis, :])
+
+
 def norm_center_diff(center_1: np.ndarray, center_2: np.ndarray, std_1: np.ndarray, std_2: np.ndarray) -> float:
     """Return the distance between two center points, normalised by the
     standard deviations of the series.
@@ -104,11 +114,27 @@ def norm_center_diff(center_1: np.ndarray, center_2: np.ndarray, std_1: np.ndarr
     return float(distance(norm_center_1[0], norm_center_1[1], norm_center_2[0], norm_center_2[1]))
 
 
+def pairwise_center_diff(centers: np.ndarray) -> np.ndarray:
+    """Vectorised version of `norm_center_diff`. Given an (N, 2) (or
+    larger) array of center points, where the first two columns are
+    latitude and longitude, return an (N, N) array whose [i, j]th
+    element is the distance between the ith and jth center points.
+    """
+    centers = np.asarray(centers, dtype=float)
+    lat = centers[:, 0]
+    lon = centers[:, 1]
+    return distance(lat[:, np.newaxis], lon[:, np.newaxis], lat[np.newaxis, :], lon[np.newaxis, :])
+
+
 def norm_dtw(series_1: np.ndarray, series_2: np.ndarray) -> float:
     """Normalise two series and perform DTW.
     - z-normalisation to account for variance.
     - divide by average length to account for length.
     """
-    series_1 = (series_1 - series_1.mean()) / series_1.std()
-    series_2 = (series_2 - series_2.mean()) / series_2.std()
+    # Work on plain (column-wise) arrays rather than DataFrames, to avoid pandas' per-operation overhead. ddof=1 to
+    # match pandas' std.
+    series_1 = np.asarray(series_1, dtype=float)
+    series_2 = np.asarray(series_2, dtype=float)
+    series_1 = (series_1 - series_1.mean(axis=0)) / series_1.std(axis=0, ddof=1)
+    series_2 = (series_2 - series_2.mean(axis=0)) / series_2.std(axis=0, ddof=1)
     return fastdtw(series_1, series_2, dist=2)[0] / ((len(series_1) + len(series_2)) / 2)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+from collections import deque
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, AbstractSet, Callable
+from typing import Optional, AbstractSet, Callable, Deque, List
 
 from logging import CRITICAL, ERROR, WARNING, INFO, DEBUG, NOTSET, Logger
 
@@ -23,10 +24,15 @@ class Message:
 class MessageBus:
     """A class for sending and retrieving different messages for
     display to the user.
+
+    At most `MAX_MESSAGES` messages are held; if more are added without
+    being retrieved, the oldest are discarded (and a warning is logged).
     """
 
+    MAX_MESSAGES = 64
+
     def __init__(self):
-        self._messages = []
+        self._messages: Deque[Message] = deque(maxlen=self.MAX_MESSAGES)
 
     def add_message(self, text: str, severity: int = INFO, views: Optional[AbstractSet[str]] = None,
                     timestamp: Optional[datetime] = None, logger_: Optional[Logger] = None) -> Message:
@@ -39,6 +45,8 @@ class MessageBus:
             views=views,
             timestamp=timestamp
         )
+        if len(self._messages) == self.MAX_MESSAGES:
+            logger.warning('Message bus is full; discarding oldest unread message: %s', self._messages[0].text)
         self._messages.append(msg)
         if logger_ is not None:
             logger_.log(severity, text)
@@ -68,6 +76,9 @@ class MessageBus:
                      discard: bool = True, discard_less_severe: bool = True):
         #print('getting messages.')
         #print(f'all messages: {self._messages}')
+        if discard and discard_less_severe and (view is None) and (severity <= NOTSET) and not exact_severity:
+            # Every message is to be shown and discarded, so there is no need to filter.
+            return self.drain()
         show_predicate = self._get_predicate(severity, view, exact_severity)
         to_show = list(filter(show_predicate, self._messages))
         logger.debug(f'Fetched {len(to_show)} messages.')
@@ -77,10 +88,19 @@ class MessageBus:
                 keep_predicate = self._get_predicate(NOTSET, view, False)
             else:
                 keep_predicate = show_predicate
-            self._messages = list(filter(lambda m: not keep_predicate(m), self._messages))
+            self._messages = deque(filter(lambda m: not keep_predicate(m), self._messages), maxlen=self.MAX_MESSAGES)
         return to_show
 
+    def drain(self) -> List[Message]:
+        """Return all messages (regardless of severity or view) and
+        discard them.
+        """
+        messages = list(self._messages)
+        self._messages.clear()
+        logger.debug(f'Drained {len(messages)} messages.')
+        return messages
+
     def copy(self) -> MessageBus:
         copy = MessageBus()
-        copy._messages = self._messages[:]
+        copy._messages = self._messages.copy()
         return copy
\ No newline at end of file
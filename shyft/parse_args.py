@@ -4,7 +4,6 @@ from collections import OrderedDict
 from typing import Tuple
 
 from shyft.config import Config
-from shyft.app.app import get_apps
 from shyft.logger import get_logger
 
 
@@ -24,6 +23,8 @@ def handle_universal_options(ns: Namespace) -> Tuple[Config, logging.Logger]:
 
 def run_app(ns: Namespace):
     """Run the Dash app."""
+    # Imported here so that other commands don't have to import Dash, Flask, etc.
+    from shyft.app.app import get_apps
     config, logger = handle_universal_options(ns)
     logger.debug('Running "run" command.')
     _, dash_app = get_apps(config)
@@ -2,7 +2,7 @@
 
 # Handle circular import issue when using type hints
 from __future__ import annotations
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Optional, NamedTuple
 
 from shyft.metadata import APP_NAME, VERSION
 
@@ -20,31 +20,31 @@ from shyft.serialize._xml_namespaces import GPX_NAMESPACES as NAMESPACES
 TPE_URL = NAMESPACES['garmin_tpe']
 
 
-def _get_point_extensions(point_data: pd.Series) -> Optional[lxml.etree.Element]:
+def _get_point_extensions(point_data: NamedTuple) -> Optional[lxml.etree.Element]:
     # gpxtpx namespace is defined at the global level in activity_to_gpx
     ext_elem = lxml.etree.Element(f'{{{TPE_URL}}}TrackPointExtension')
     has_ext = False
-    if not pd.isnull(point_data['hr']):
+    if not pd.isnull(point_data.hr):
         has_ext = True
         hr_elem = lxml.etree.Element(f'{{{TPE_URL}}}hr')
-        hr_elem.text = str(point_data['hr'])
+        hr_elem.text = str(point_data.hr)
         ext_elem.append(hr_elem)
-    if not pd.isnull(point_data['cadence']):
+    if not pd.isnull(point_data.cadence):
         has_ext = True
         cad_elem = lxml.etree.Element(f'{{{TPE_URL}}}cad')
-        cad_elem.text = str(point_data['cadence'])
+        cad_elem.text = str(point_data.cadence)
         ext_elem.append(cad_elem)
 
     return ext_elem if has_ext else None
 
 
-def _add_point_to_seg(point_data: pd.Series, seg: gpx.GPXTrackSegment):
-    #print(point_data)
+def _add_point_to_seg(point_data: NamedTuple, seg: gpx.GPXTrackSegment):
+    # point_data is a row of activity.points, as yielded by itertuples
     point = gpx.GPXTrackPoint(
-        point_data['latitude'],
-        point_data['longitude'],
-        point_data['elevation'],
-        point_data['time']
+        point_data.latitude,
+        point_data.longitude,
+        point_data.elevation,
+        point_data.time
     )
     ext = _get_point_extensions(point_data)
     if ext is not None:
@@ -64,7 +64,8 @@ def activity_to_gpx(activity: Activity) -> gpx.GPX:
     track.type = activity.metadata.activity_type
     seg = gpx.GPXTrackSegment()
     track.segments.append(seg)
-    points.apply(lambda row: _add_point_to_seg(row, seg), axis=1)
+    for row in points.itertuples(index=False):
+        _add_point_to_seg(row, seg)
     g.tracks.append(track)
     return g
 
@@ -1,7 +1,7 @@
 """Functions for creating TCX files from Activities."""
 
 from __future__ import annotations
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Optional, NamedTuple
 
 from shyft.serialize import _activity_types
 
@@ -22,9 +22,10 @@ def _tcx_elem(name: str, attrib: Optional[dict] = None, ns_name: Optional[str] =
     return lxml.etree.Element(f'{{{ns}}}{name}', attrib=attrib, nsmap=TCX_NAMESPACES)
 
 
-def _create_point_elem(point: pd.Series, track_elem: lxml.etree._Element):
-    """Create a Trackpoint element from a pd.Series representing a
-    single point, and append it to `track_elem`.
+def _create_point_elem(point: NamedTuple, track_elem: lxml.etree._Element):
+    """Create a Trackpoint element from a namedtuple representing a
+    single point (ie, a row of activity.points as yielded by
+    `itertuples`), and append it to `track_elem`.
     """
     # The TCX schema states that a Trackpoint *must* have a "Time" element
     # and *may* have the following elements (order matters):
@@ -38,43 +39,46 @@ def _create_point_elem(point: pd.Series, track_elem: lxml.etree._Element):
     tp_elem = _tcx_elem('Trackpoint')
 
     time_elem = _tcx_elem('Time')
-    time_elem.text = point['time'].isoformat()
+    time_elem.text = point.time.isoformat()
     tp_elem.append(time_elem)
 
     pos_elem = _tcx_elem('Position')
     lat_elem = _tcx_elem('LatitudeDegrees')
-    lat_elem.text = str(point['latitude'])
+    lat_elem.text = str(point.latitude)
     pos_elem.append(lat_elem)
     lon_elem = _tcx_elem('LongitudeDegrees')
-    lon_elem.text = str(point['longitude'])
+    lon_elem.text = str(point.longitude)
     pos_elem.append(lon_elem)
     tp_elem.append(pos_elem)
 
-    if ('elevation' in point) and pd.notnull(point['elevation']):
+    elevation = getattr(point, 'elevation', None)
+    if pd.notnull(elevation):
         elev_elem = _tcx_elem('AltitudeMeters')
-        elev_elem.text = str(point['elevation'])
+        elev_elem.text = str(elevation)
         tp_elem.append(elev_elem)
 
     dist_elem = _tcx_elem('DistanceMeters')
-    dist_elem.text = str(point['cumul_distance_2d'])
+    dist_elem.text = str(point.cumul_distance_2d)
     tp_elem.append(dist_elem)
 
-    if ('hr' in point) and (pd.notnull(point['hr'])):
+    hr = getattr(point, 'hr', None)
+    if pd.notnull(hr):
         hr_elem = _tcx_elem('HeartRateBpm')
         hr_val_elem = _tcx_elem('Value')
-        hr_val_elem.text = str(round(point['hr']))
+        hr_val_elem.text = str(round(hr))
         hr_elem.append(hr_val_elem)
         tp_elem.append(hr_elem)
 
-    if ('cadence' in point) and (pd.notnull(point['cadence'])):
+    cadence = getattr(point, 'cadence', None)
+    if pd.notnull(cadence):
         cad_elem = _tcx_elem('Cadence')
-        cad_elem.text = str(round(point['cadence']))
+        cad_elem.text = str(round(cadence))
         tp_elem.append(cad_elem)
 
     ext_elem = _tcx_elem('Extensions')
     act_ext_elem = _tcx_elem('TPX', ns_name='activity_extension')
     speed_ext_elem = _tcx_elem('Speed', ns_name='activity_extension')
-    speed_ext_elem.text = str(point['kmph'] / 3.6)
+    speed_ext_elem.text = str(point.kmph / 3.6)
     act_ext_elem.append(speed_ext_elem)
     ext_elem.append(act_ext_elem)
     tp_elem.append(ext_elem)
@@ -87,7 +91,9 @@ def _create_track_elem(points: pd.DataFrame) -> lxml.etree._Element:
     # The TCX schema states that a Track element *must* have at least one Trackpoint element.
 
     track_elem = _tcx_elem('Track')
-    points.apply(_create_point_elem, args=(track_elem,), axis=1)
+    # itertuples avoids constructing a pd.Series for every point, as DataFrame.apply(axis=1) would.
+    for point in points.itertuples(index=False):
+        _create_point_elem(point, track_elem)
     return track_elem
 
 
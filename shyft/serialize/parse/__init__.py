@@ -14,9 +14,9 @@ PARSERS = {
 
 def parser_factory(fpath: str, config: Config) -> BaseParser:
     logger.info(f'Choosing parser for file "{fpath}".')
-    _, ext = os.path.splitext(fpath.lower())
+    _, ext = os.path.splitext(fpath)
     try:
-        parser = PARSERS[ext]
+        parser = PARSERS[ext.lower()]
     except KeyError:
         raise ValueError(f'No suitable parser found for file "{fpath}".')
     logger.info(f'Chose parser "{parser.__name__}".')
@@ -1,22 +1,33 @@
 """Base code for unit testing, including base test classes and variables
 describing where to find and save test data, for use by test scripts.
 """
-import filecmp
+import glob
+import hashlib
+import logging
+import mmap
 import os
 import shutil
+import sqlite3
+import tempfile
+import threading
 import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from shutil import copyfile
-from typing import List, Optional, Collection, Iterable
+from functools import lru_cache
+from operator import attrgetter
+from typing import List, Optional, Collection, Iterable, Tuple, Sequence, Dict
 
 import numpy as np
 import pandas as pd
 import gpxpy
+import lxml.etree
 
 from shyft.config import Config
 from shyft.activity_manager import ActivityManager
 
 from shyft.activity import ActivityMetaData, Activity
+from shyft.geo_utils import pairwise_center_diff, pairwise_norm_length_diff
 from shyft.df_utils.validate import DataFrameSchema
 from shyft.df_utils.schemas import points_schema, laps_splits_km_schema, laps_splits_mile_schema, \
     metadata_summary_schema
@@ -31,6 +42,14 @@ TEST_ACTIVITY_GRAPHS_FILE = os.path.join(TEST_DATA_DIR, 'test_activity_graphs.js
 TEST_OVERVIEW_GRAPHS_FILE = os.path.join(TEST_DATA_DIR, 'test_overview_graphs.json')
 
 TEST_LOGS_DIR = os.path.join(TEST_RUN_DATA_DIR_BASE, '__logs__')
+# The level at which the tests log to file. Logging everything at DEBUG level slows the tests down, so only do that
+# when asked to, eg, by running with SHYFT_TEST_LOG_LEVEL=DEBUG.
+_TEST_LOG_LEVEL_NAME = os.environ.get('SHYFT_TEST_LOG_LEVEL', 'WARNING').upper()
+# getLevelName returns the level's number for a known level name, but a string (rather than an error) for anything else.
+TEST_LOG_LEVEL = logging.getLevelName(_TEST_LOG_LEVEL_NAME)
+if not isinstance(TEST_LOG_LEVEL, int):
+    raise ValueError(f'Bad value for SHYFT_TEST_LOG_LEVEL: "{_TEST_LOG_LEVEL_NAME}". Should be one of CRITICAL, ERROR, '
+                     'WARNING, INFO, DEBUG or NOTSET.')
 if not os.path.exists(TEST_LOGS_DIR):
     os.makedirs(TEST_LOGS_DIR)
 
@@ -39,25 +58,27 @@ if not os.path.exists(TEST_LOGS_DIR):
 # 2 and 3 should loose- and tight-match each other but not match any others.
 # 4 and 5 should loose- but not tight-match each other.
 # TBC if 6 should match 4 or 5.
-TEST_GPX_FILES = [
-    os.path.join(TEST_GPX_FILES_DIR, 'GNR_2019.gpx'),                   # 0     2019-09-08
-    os.path.join(TEST_GPX_FILES_DIR, 'Morning_Run_Miami.gpx'),          # 1     2019-10-30
-    os.path.join(TEST_GPX_FILES_DIR, '2020_08_05_pp_9k_ccw.gpx'),       # 2     2020-08-05
-    os.path.join(TEST_GPX_FILES_DIR, '2020_08_04_pp_9k_ccw.gpx'),       # 3     2020-08-04
-    os.path.join(TEST_GPX_FILES_DIR, '2020_03_20_pp_7.22k_cw.gpx'),     # 4     2020-03-20
-    os.path.join(TEST_GPX_FILES_DIR, '2020_06_18_pp_7.23k_ccw.gpx'),    # 5     2020-06-18
-    os.path.join(TEST_GPX_FILES_DIR, '2019_07_08_pp_7k_ccw.gpx'),       # 6     2019-07-08
-    os.path.join(TEST_GPX_FILES_DIR, 'Calcutta_Run_10k_2019.gpx'),      # 7     2019
-    os.path.join(TEST_GPX_FILES_DIR, 'cuilcagh_walk_2019.gpx'),         # 8     2019
-    os.path.join(TEST_GPX_FILES_DIR, 'fermanagh_walk_2019.gpx'),        # 9     2019
-    os.path.join(TEST_GPX_FILES_DIR, 'Frank_Duffy_10_Mile_2019.gpx'),   # 10    2019
-    os.path.join(TEST_GPX_FILES_DIR, 'Great_Ireland_Run_2019.gpx'),     # 11    2019
-    os.path.join(TEST_GPX_FILES_DIR, 'howth_walk_2019.gpx'),            # 12    2019
-    os.path.join(TEST_GPX_FILES_DIR, 'Irish_Runner_10_Mile_2019.gpx'),  # 13    2019
-    os.path.join(TEST_GPX_FILES_DIR, 'run_in_the_dark_10k_2019.gpx'),   # 14    2019
-    os.path.join(TEST_GPX_FILES_DIR, 'path_of_gods_walk_2020.gpx'),     # 15    2020-10-11
-    os.path.join(TEST_GPX_FILES_DIR, 'amalfi_ironworks_walk_2020.gpx')  # 16    2020-10-13
-]
+TEST_GPX_BASENAMES = (
+    'GNR_2019.gpx',                         # 0     2019-09-08
+    'Morning_Run_Miami.gpx',                # 1     2019-10-30
+    '2020_08_05_pp_9k_ccw.gpx',             # 2     2020-08-05
+    '2020_08_04_pp_9k_ccw.gpx',             # 3     2020-08-04
+    '2020_03_20_pp_7.22k_cw.gpx',           # 4     2020-03-20
+    '2020_06_18_pp_7.23k_ccw.gpx',          # 5     2020-06-18
+    '2019_07_08_pp_7k_ccw.gpx',             # 6     2019-07-08
+    'Calcutta_Run_10k_2019.gpx',            # 7     2019
+    'cuilcagh_walk_2019.gpx',               # 8     2019
+    'fermanagh_walk_2019.gpx',              # 9     2019
+    'Frank_Duffy_10_Mile_2019.gpx',         # 10    2019
+    'Great_Ireland_Run_2019.gpx',           # 11    2019
+    'howth_walk_2019.gpx',                  # 12    2019
+    'Irish_Runner_10_Mile_2019.gpx',        # 13    2019
+    'run_in_the_dark_10k_2019.gpx',         # 14    2019
+    'path_of_gods_walk_2020.gpx',           # 15    2020-10-11
+    'amalfi_ironworks_walk_2020.gpx'        # 16    2020-10-13
+)
+_TEST_GPX_FILES_PREFIX = TEST_GPX_FILES_DIR + os.sep
+TEST_GPX_FILES = tuple(_TEST_GPX_FILES_PREFIX + fname for fname in TEST_GPX_BASENAMES)
 
 # These have both .gpx and .fit files
 FIT_TCX_GPX = (
@@ -71,13 +92,13 @@ FIT_TCX_GPX = (
     'path_of_gods_walk_2020'
 )
 
-TEST_GPX_FILES_2 = [os.path.join(TEST_GPX_FILES_DIR, f'{fname}.gpx') for fname in FIT_TCX_GPX]
-TEST_FIT_FILES = [os.path.join(TEST_FIT_FILES_DIR, f'{fname}.fit') for fname in FIT_TCX_GPX]
-TEST_TCX_FILES = [os.path.join(TEST_TCX_FILES_DIR, f'{fname}.tcx') for fname in FIT_TCX_GPX]
+TEST_GPX_FILES_2 = tuple(os.path.join(TEST_GPX_FILES_DIR, f'{fname}.gpx') for fname in FIT_TCX_GPX)
+TEST_FIT_FILES = tuple(os.path.join(TEST_FIT_FILES_DIR, f'{fname}.fit') for fname in FIT_TCX_GPX)
+TEST_TCX_FILES = tuple(os.path.join(TEST_TCX_FILES_DIR, f'{fname}.tcx') for fname in FIT_TCX_GPX)
 
 # GPX files generated by Runkeeper
 RK_GPX_DIR = os.path.join(TEST_GPX_FILES_DIR, 'runkeeper')
-RK_GPX_FILES = [os.path.join(RK_GPX_DIR, f'{fname}.gpx') for fname in FIT_TCX_GPX]
+RK_GPX_FILES = tuple(os.path.join(RK_GPX_DIR, f'{fname}.gpx') for fname in FIT_TCX_GPX)
 
 # ints here are index values in TEST_GPX_FILES
 LOOSE_MATCH = (
@@ -95,32 +116,164 @@ ACTIVITIES_2019 = (0, 1, 6, 7, 8, 9, 10, 11, 12, 13, 14)
 ACTIVITIES_2020 = (2, 3, 4, 5, 15, 16)
 ACTIVITIES_2020_08 = (2, 3)
 
+# Metadata fields which assert_metadata_equal always compares for exact equality.
+METADATA_EQUAL_FIELDS = ('activity_id', 'date_time', 'name', 'description')
+
+# Some points columns can't really be compared for "almost" equality in the way that we want, so we have to drop these
+# when comparing activities with almost=True.
+# TODO: Find other ways to compare the dropped columns.
+ALMOST_IGNORE_POINTS_COLS = frozenset(('km_pace', 'mile_pace', 'mile', 'km', 'kmph', 'mph'))
+
+
+def _dir_has_contents(dpath: str) -> bool:
+    with os.scandir(dpath) as it:
+        return any(True for _ in it)
+
+def _rmtrees(dpaths: Iterable[str]):
+    for dpath in dpaths:
+        shutil.rmtree(dpath, ignore_errors=True)
 
 def run_data_dir(name: str, replace: bool = False) -> str:
     data_dir = os.path.join(TEST_RUN_DATA_DIR_BASE, name)
-    if replace and os.path.exists(data_dir):
-        shutil.rmtree(data_dir)
+    if replace:
+        # Old directories which a previous (eg, interrupted) run moved aside but didn't finish deleting.
+        old_data_dirs = glob.glob(f'{glob.escape(data_dir)}.old.*')
+        if os.path.exists(data_dir) and _dir_has_contents(data_dir):
+            # Move the old directory out of the way (which is a single rename) and delete it in the background, so
+            # that the tests don't have to wait for it to be deleted. The deleting thread is a daemon, so it doesn't
+            # keep the interpreter alive; anything it doesn't get to is swept up by the next run.
+            old_data_dir = f'{data_dir}.old.{uuid.uuid4().hex}'
+            os.rename(data_dir, old_data_dir)
+            old_data_dirs.append(old_data_dir)
+        if old_data_dirs:
+            threading.Thread(target=_rmtrees, args=(old_data_dirs,), daemon=True).start()
     os.makedirs(data_dir, exist_ok=True)
     return data_dir
 
+def temp_run_data_dir(name: str) -> tempfile.TemporaryDirectory:
+    """Return a new, empty temporary run data directory whose name
+    begins with `name`. Unlike `run_data_dir`, this never needs to
+    remove the contents of a previous run before the tests start; the
+    caller is responsible for calling its `cleanup` method.
+    """
+    os.makedirs(TEST_RUN_DATA_DIR_BASE, exist_ok=True)
+    return tempfile.TemporaryDirectory(prefix=f'{name}_', dir=TEST_RUN_DATA_DIR_BASE)
+
+@lru_cache(maxsize=None)
+def _test_config_bytes() -> bytes:
+    """Return the contents of the base test config file, which is read
+    only once no matter how many run directories are set up.
+    """
+    with open(TEST_CONFIG_FILE_BASE, 'rb') as f:
+        return f.read()
+
 def config_file(run_dir: str) -> str:
     config_fpath = os.path.join(run_dir, 'config.ini')
-    copyfile(TEST_CONFIG_FILE_BASE, config_fpath)
+    with open(config_fpath, 'wb') as f:
+        f.write(_test_config_bytes())
     return config_fpath
 
 def get_config(run_dir: str) -> Config:
     conf_file = config_file(run_dir)
     return Config(conf_file, data_dir=run_dir)
 
-def get_manager(config: Config, files: Optional[List[str]] = None) -> ActivityManager:
+# Durability doesn't matter for the test databases, so use write-ahead logging and only sync at checkpoints, rather
+# than syncing the journal and the database on every commit. The test databases are small, so also let SQLite keep
+# them (and any temporary tables and indices) in memory: a 64 MiB page cache and up to 256 MiB memory-mapped.
+TEST_DB_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+)
+
+def get_manager(config: Config, files: Optional[Iterable[str]] = None) -> ActivityManager:
     manager = ActivityManager(config)
+    for pragma in TEST_DB_PRAGMAS:
+        manager.dbm.sql_execute(pragma)
     if files:
-        for f in files:
-            manager.add_activity_from_file(f)
+        manager.add_activities_from_files(list(files))
     return manager
 
-def copy_manager(am: ActivityManager) -> ActivityManager:
-    old_config = am.config
+# The metadata attributes of an Activity which point to files created alongside it.
+_ACTIVITY_DATA_FILE_ATTRS = ('thumbnail_file', 'gpx_file', 'tcx_file', 'source_file')
+
+def file_digest(fpath: str) -> bytes:
+    """Return the BLAKE2b digest of the contents of the given file."""
+    with open(fpath, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            # Can't mmap an empty file
+            return hashlib.blake2b().digest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.blake2b(mm).digest()
+
+def files_equal(fpath1: str, fpath2: str) -> bool:
+    """Return whether the contents of the two given files are the same.
+    Files of different sizes are never equal; otherwise, the files'
+    hashes are compared.
+    """
+    if os.path.getsize(fpath1) != os.path.getsize(fpath2):
+        return False
+    return file_digest(fpath1) == file_digest(fpath2)
+
+# The constants gpxpy uses to calculate distances (from the WGS84 datum).
+_GPXPY_EARTH_RADIUS = 6378.137 * 1000
+_GPXPY_ONE_DEGREE = (2 * np.pi * _GPXPY_EARTH_RADIUS) / 360
+
+def gpx_length_2d(fpath: str) -> float:
+    """Return the 2D length (in metres) of the tracks in the given GPX
+    file, calculated in the same way as gpxpy's `GPX.length_2d` but
+    without building a gpxpy object for every point.
+
+    As in gpxpy, the distance between each pair of consecutive points in
+    a track segment is the naive distance, unless the points are more
+    than 0.2 degrees apart, in which case the haversine distance is used.
+    The formulae are reproduced here (rather than using those in
+    `shyft.geo_utils`) so that this remains an independent reference for
+    the lengths that shyft calculates.
+    """
+    length = 0.0
+    for _, seg in lxml.etree.iterparse(fpath, tag='{*}trkseg'):
+        coords = np.array([(float(p.get('lat')), float(p.get('lon'))) for p in seg.iterfind('{*}trkpt')])
+        seg.clear()
+        if len(coords) < 2:
+            continue
+        # gpxpy measures the distance from each point to the previous point
+        lat1, lon1 = coords[1:, 0], coords[1:, 1]
+        lat2, lon2 = coords[:-1, 0], coords[:-1, 1]
+        d_lat = lat1 - lat2
+        d_lon = lon1 - lon2
+        far = (np.abs(d_lat) > 0.2) | (np.abs(d_lon) > 0.2)
+        rad_lat1 = np.radians(lat1)
+        a = np.sin(np.radians(d_lat) / 2) ** 2 \
+            + np.sin(np.radians(d_lon) / 2) ** 2 * np.cos(rad_lat1) * np.cos(np.radians(lat2))
+        haversine = _GPXPY_EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        naive = np.sqrt(d_lat ** 2 + (d_lon * np.cos(rad_lat1)) ** 2) * _GPXPY_ONE_DEGREE
+        length += np.where(far, haversine, naive).sum()
+    return length
+
+def loose_match_matrix(manager: ActivityManager, activities: Sequence[Activity]) -> np.ndarray:
+    """Return an (N, N) boolean array whose [i, j]th element is True
+    if `activities[i]` and `activities[j]` loose match using `manager`'s
+    thresholds, calculated for all pairs at once.
+
+    This uses the vectorised equivalents of the functions that
+    `ActivityManager.loose_match_routes` uses, so results for pairs very
+    close to a threshold may differ from it in the last floating point
+    place.
+    """
+    centers = np.array([a.metadata.center[:2] for a in activities], dtype=float).reshape(-1, 2)
+    lengths = np.array([a.metadata.distance_2d_km for a in activities], dtype=float)
+    return (
+            (pairwise_center_diff(centers) < manager.config.match_center_threshold)
+            & (pairwise_norm_length_diff(lengths) < manager.config.match_length_threshold)
+    )
+
+def _copy_config(old_config: Config) -> Config:
+    """Return a copy of the given Config with a new data directory,
+    which does not yet exist.
+    """
     old_data_dir = old_config.data_dir
     i = 0
     new_data_dir = old_data_dir + f'_copy_{i}'
@@ -130,8 +283,77 @@ def copy_manager(am: ActivityManager) -> ActivityManager:
     config = Config(old_config.ini_fpath, old_config.activity_graphs_fpath, old_config.overview_graphs_fpath,
                     **old_config.kwargs)
     config.data_dir = new_data_dir
+    return config
+
+def copy_manager(am: ActivityManager) -> ActivityManager:
+    """Return a new ActivityManager to which the source files of all
+    of `am`'s activities have been added.
+    """
+    config = _copy_config(am.config)
     return get_manager(config, files=[a.metadata.source_file for a in am])
 
+def snapshot_manager(am: ActivityManager) -> ActivityManager:
+    """Return a new ActivityManager whose database and data files are
+    a copy of `am`'s, so that it can be modified without affecting `am`.
+
+    Unlike `copy_manager`, no files are parsed and no activities are
+    added; the data directory is copied and the database is copied using
+    SQLite's backup API.
+    """
+    old_config = am.config
+    config = _copy_config(old_config)
+    db_fname = os.path.basename(old_config.db_file)
+    shutil.copytree(old_config.data_dir, config.data_dir, ignore=shutil.ignore_patterns(f'{db_fname}*'),
+                    dirs_exist_ok=True)
+    am.dbm.commit()
+    dest = sqlite3.connect(config.db_file)
+    try:
+        am.dbm.connection.backup(dest)
+    finally:
+        dest.close()
+    manager = get_manager(config)
+    # The copied metadata still refers to the data files in the original data directory.
+    _relocate_data_files(manager.dbm.connection, old_config.data_dir, config.data_dir)
+    return manager
+
+def _relocate_data_files(connection: sqlite3.Connection, old_data_dir: str, new_data_dir: str):
+    """Change the paths to activities' data files stored in the given
+    database so that they point to `new_data_dir` instead of
+    `old_data_dir`, and commit.
+    """
+    for col in _ACTIVITY_DATA_FILE_ATTRS:
+        connection.execute(f'UPDATE "activities" SET {col} = replace({col}, ?, ?)', (old_data_dir, new_data_dir))
+    connection.commit()
+
+def table_differences(am1: ActivityManager, am2: ActivityManager,
+                      tables: Iterable[str] = ('activities', 'points', 'laps', 'prototypes')) -> Dict[str, int]:
+    """Return, for each of the given tables, the number of rows that
+    are in one of the two managers' databases but not the other.
+
+    The databases are compared by SQLite (with one attached to the
+    other), without loading any activities. The paths to activities'
+    data files are not compared, as they depend on the data directory.
+    """
+    am1.dbm.commit()
+    am2.dbm.commit()
+    connection = sqlite3.connect(am1.config.db_file)
+    try:
+        connection.execute('ATTACH DATABASE ? AS other', (am2.config.db_file,))
+        diffs = {}
+        for table in tables:
+            cols = ', '.join(row[1] for row in connection.execute(f'PRAGMA main.table_info("{table}")')
+                             if row[1] not in _ACTIVITY_DATA_FILE_ATTRS)
+            count = 0
+            for db1, db2 in (('main', 'other'), ('other', 'main')):
+                count += connection.execute(
+                    f'SELECT COUNT(*) FROM '
+                    f'(SELECT {cols} FROM {db1}."{table}" EXCEPT SELECT {cols} FROM {db2}."{table}")'
+                ).fetchone()[0]
+            diffs[table] = count
+        return diffs
+    finally:
+        connection.close()
+
 class BaseDataFrameValidateTestCase(unittest.TestCase):
 
     def assert_dataframe_valid(self, df: pd.DataFrame, schema: DataFrameSchema, df_name: str = None):
@@ -190,19 +412,37 @@ class BaseTestCase(BaseDataFrameValidateTestCase):
         self.assertAlmostEqual(td1.total_seconds(), td2.total_seconds(), places)
 
     def assert_files_equal(self, fpath1: str, fpath2: str):
-        self.assertTrue(filecmp.cmp(fpath1, fpath2), f'{fpath1} is not equal to {fpath2}.')
+        self.assertTrue(files_equal(fpath1, fpath2), f'{fpath1} is not equal to {fpath2}.')
+
+    def assert_file_pairs_equal(self, pairs: Iterable[Tuple[str, str]]):
+        """Assert that, for each pair of filepaths in `pairs`, the two
+        files are equal. The files are read and compared concurrently.
+        """
+        pairs = list(pairs)
+        with ThreadPoolExecutor() as executor:
+            results = list(executor.map(lambda p: files_equal(*p), pairs))
+        for (fpath1, fpath2), equal in zip(pairs, results):
+            self.assertTrue(equal, f'{fpath1} is not equal to {fpath2}.')
 
     def assert_metadata_equal(self, md1: ActivityMetaData, md2: ActivityMetaData,
                               almost: bool = False, check_data_files: bool = True, check_types: bool = True,
                               check_elev: bool = True, check_format: bool = True):
 
-        self.assertEqual(md1.activity_id, md2.activity_id,
-                         msg=f'Activity IDs are not the same ({md1.activity_id} vs {md2.activity_id}).')
+        fields = list(METADATA_EQUAL_FIELDS)
         if check_types:
-            self.assertEqual(md1.activity_type, md2.activity_type,
-                             msg=f'Activity types are not the same ({md1.activity_type} vs {md2.activity_type}).')
-        self.assertEqual(md1.date_time, md2.date_time,
-                         msg=f'Activity times are not the same ({md1.date_time} vs {md2.date_time}).')
+            fields.append('activity_type')
+        fields.append('prototype_id')
+        if check_format:
+            fields.append('source_format')
+        if not almost:
+            fields.append('distance_2d_km')
+        # Fetch and compare all the fields in one go, only looking at the individual fields if they are not all equal.
+        getter = attrgetter(*fields)
+        values1 = getter(md1)
+        values2 = getter(md2)
+        if values1 != values2:
+            diffs = '; '.join(f'{f} ({v1} vs {v2})' for f, v1, v2 in zip(fields, values1, values2) if v1 != v2)
+            self.fail(f'Activity metadata are not the same: {diffs}.')
 
         if check_elev:
             center1 = md1.center
@@ -216,40 +456,57 @@ class BaseTestCase(BaseDataFrameValidateTestCase):
             std2 = md2.points_std[:2]
 
         if almost:
-            # NOTE: Tests equality to within 0.5km. Obviously not very satisfactory, but unfortunately the difference
-            # between the distance reported by a device and that measured by adding up the haversine distances between
-            # points can often be out by as much as a few hundred metres. Possible because of some proprietary
-            # adjustment algorithm used by the device.
-            self.assertAlmostEqual(md1.distance_2d_km, md2.distance_2d_km, delta=0.5,
-                                   msg=f'Activity distances are not the same ({md1.distance_2d_km} vs {md2.distance_2d_km}).')
-            np.testing.assert_array_almost_equal(center1, center2, decimal=2)
-            np.testing.assert_array_almost_equal(std1, std2, decimal=2)
+            self._assert_metadata_values_almost_equal(md1, md2, center1, center2, std1, std2)
         else:
-            self.assertEqual(md1.distance_2d_km, md2.distance_2d_km,
-                             msg=f'Activity distances are not the same ({md1.distance_2d_km} vs {md2.distance_2d_km}).')
             np.testing.assert_array_equal(center1, center2)
             np.testing.assert_array_equal(std1, std2)
-        if almost:
-            self.assert_timedeltas_almost_equal(md1.mean_km_pace, md2.mean_km_pace, -3)
-            self.assert_timedeltas_almost_equal(md1.mean_mile_pace, md2.mean_mile_pace, -3)
-            self.assert_timedeltas_almost_equal(md1.duration, md2.duration, -3)
-        else:
-            self.assert_timedeltas_almost_equal(md1.mean_km_pace, md2.mean_km_pace)
-            self.assert_timedeltas_almost_equal(md1.mean_mile_pace, md2.mean_mile_pace)
-            self.assert_timedeltas_almost_equal(md1.duration, md2.duration)
-        self.assertEqual(md1.prototype_id, md2.prototype_id,
-                         msg=f'Prototype IDs are not the same ({md1.prototype_id} vs {md2.prototype_id}).')
-        self.assertEqual(md1.name, md2.name,
-                         msg=f'Activity names are not the same ({md1.name} vs {md2.name}).')
-        self.assertEqual(md1.description, md2.description,
-                         msg=f'Activity descriptions are not the same ({md1.description} vs {md2.description}).')
-        if check_format:
-            self.assertEqual(md1.source_format, md2.source_format)
+            # Paces and durations must be equal to 4 decimal places (in seconds).
+            np.testing.assert_allclose(
+                [td.total_seconds() for td in (md1.mean_km_pace, md1.mean_mile_pace, md1.duration)],
+                [td.total_seconds() for td in (md2.mean_km_pace, md2.mean_mile_pace, md2.duration)],
+                rtol=0, atol=5e-5, err_msg='Activity paces or durations are not the same.'
+            )
         if not almost:
             self.assert_files_equal(md1.thumbnail_file, md2.thumbnail_file)
         if check_data_files:
             self.assert_files_equal(md1.gpx_file, md2.gpx_file)
 
+    def _assert_metadata_values_almost_equal(self, md1: ActivityMetaData, md2: ActivityMetaData,
+                                             center1: np.ndarray, center2: np.ndarray,
+                                             std1: np.ndarray, std2: np.ndarray):
+        """Compare the numeric metadata values of two activities for
+        "almost" equality, in a single vectorised comparison.
+        """
+        # Tolerances for each value:
+        # - Distances must be equal to within 0.5km. Obviously not very satisfactory, but unfortunately the difference
+        #   between the distance reported by a device and that measured by adding up the haversine distances between
+        #   points can often be out by as much as a few hundred metres. Possible because of some proprietary adjustment
+        #   algorithm used by the device.
+        # - Centers and standard deviations must be equal to 2 decimal places (as assert_array_almost_equal).
+        # - Durations and paces must be equal to within 500 seconds (ie, to -3 places, as assertAlmostEqual).
+        labels = (['distance_2d_km'] + [f'center[{i}]' for i in range(len(center1))]
+                  + [f'points_std[{i}]' for i in range(len(std1))] + ['mean_km_pace', 'mean_mile_pace', 'duration'])
+        tolerances = np.array([0.5] + [1.5e-2] * (len(center1) + len(std1)) + [500] * 3)
+
+        def _values(md: ActivityMetaData, center: np.ndarray, std: np.ndarray) -> np.ndarray:
+            return np.array([
+                md.distance_2d_km,
+                *center,
+                *std,
+                md.mean_km_pace.total_seconds(),
+                md.mean_mile_pace.total_seconds(),
+                md.duration.total_seconds()
+            ], dtype=float)
+
+        values1 = _values(md1, center1, std1)
+        values2 = _values(md2, center2, std2)
+        self.assertEqual(len(values1), len(values2), msg='Activity centers or standard deviations differ in length.')
+        with np.errstate(invalid='ignore'):
+            ok = (np.abs(values1 - values2) <= tolerances) | (np.isnan(values1) & np.isnan(values2))
+        if not ok.all():
+            diffs = '; '.join(f'{labels[i]} ({values1[i]} vs {values2[i]})' for i in np.flatnonzero(~ok))
+            raise AssertionError(f'Activity metadata values are not almost the same: {diffs}.')
+
     def assert_activities_equal(self, a1: Activity, a2: Activity, almost: bool = False, check_data_files: bool = True,
                                 check_types: bool = True, ignore_points_cols: Optional[List[str]] = None,
                                 check_laps: bool = True, check_elev: bool = True, ignore_laps_cols=None,
@@ -260,11 +517,57 @@ class BaseTestCase(BaseDataFrameValidateTestCase):
 
         self.assert_metadata_equal(a1.metadata, a2.metadata, almost=almost, check_data_files=check_data_files,
                                    check_types=check_types, check_elev=check_elev, check_format=check_format)
+        points1, points2 = self._get_comparable_points(a1, a2, almost=almost, check_types=check_types,
+                                                       ignore_points_cols=ignore_points_cols, check_laps=check_laps,
+                                                       check_elev=check_elev, ignore_laps_cols=ignore_laps_cols)
+        self._assert_comparable_points_equal(points1, points2, almost=almost, check_types=check_types)
+
+    def assert_activity_lists_equal(self, activities1: List[Activity], activities2: List[Activity],
+                                    almost: bool = False, check_data_files: bool = True, check_types: bool = True,
+                                    ignore_points_cols: Optional[List[str]] = None, check_laps: bool = True,
+                                    check_elev: bool = True, ignore_laps_cols=None, check_format: bool = True):
+        """Assert that each Activity in `activities1` is equal to the
+        corresponding Activity in `activities2`. Arguments are as for
+        `assert_activities_equal`.
+
+        Metadata and laps are compared pairwise, but the points of all
+        Activities are compared in a single (batched) comparison.
+        """
+        self.assertEqual(len(activities1), len(activities2),
+                         msg=f'Lists of activities are not the same length ({len(activities1)} vs {len(activities2)}).')
+        all_points1 = {}
+        all_points2 = {}
+        for i, (a1, a2) in enumerate(zip(activities1, activities2)):
+            self.assert_metadata_equal(a1.metadata, a2.metadata, almost=almost, check_data_files=check_data_files,
+                                       check_types=check_types, check_elev=check_elev, check_format=check_format)
+            points1, points2 = self._get_comparable_points(a1, a2, almost=almost, check_types=check_types,
+                                                           ignore_points_cols=ignore_points_cols,
+                                                           check_laps=check_laps, check_elev=check_elev,
+                                                           ignore_laps_cols=ignore_laps_cols)
+            # Check columns pairwise, so that differences are not masked by concatenation.
+            self.assertSetEqual(set(points1.columns), set(points2.columns),
+                                msg=f'Points DataFrames for activity {a1.metadata.activity_id} do not have the same '
+                                    f'columns.')
+            all_points1[i] = points1
+            all_points2[i] = points2
+        if all_points1:
+            self._assert_comparable_points_equal(pd.concat(all_points1), pd.concat(all_points2), almost=almost,
+                                                 check_types=check_types)
+
+    def _get_comparable_points(self, a1: Activity, a2: Activity, almost: bool, check_types: bool,
+                               ignore_points_cols: Optional[List[str]], check_laps: bool, check_elev: bool,
+                               ignore_laps_cols: Optional[List[str]]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Compare the laps of the given Activities (if `check_laps` is
+        True) and return their points DataFrames, without any columns that
+        should not be compared.
+        """
         if ignore_laps_cols is None:
             ignore_laps_cols = []
 
         if ignore_points_cols is None:
             ignore_points_cols = []
+        else:
+            ignore_points_cols = list(ignore_points_cols)
 
         if check_laps:
             if (a1.laps is None) or (a2.laps is None):
@@ -290,25 +593,23 @@ class BaseTestCase(BaseDataFrameValidateTestCase):
             points1 = a1.points.drop('lap', axis=1)
             points2 = a2.points.drop('lap', axis=1)
 
+        if not almost:
+            return a1.points, a2.points
+
         if check_elev:
             ignore_points_cols.append('elevation')
 
-        if ignore_points_cols:
-            points1 = points1.drop(set(ignore_points_cols), axis=1)
-            points2 = points2.drop(set(ignore_points_cols), axis=1)
+        # Drop all the columns we are not comparing in one go.
+        drop_cols = ALMOST_IGNORE_POINTS_COLS.union(ignore_points_cols)
+        return points1.drop(drop_cols, axis=1), points2.drop(drop_cols, axis=1)
+
+    def _assert_comparable_points_equal(self, points1: pd.DataFrame, points2: pd.DataFrame, almost: bool,
+                                        check_types: bool):
         if almost:
-            # Some columns can't really be compared for "almost" equality in the way that we want.
-            # So we have to drop these.
-            # TODO: Find other ways to compare the dropped columns.
             rtol = 5
-            pd.testing.assert_frame_equal(
-                points1.drop(['km_pace', 'mile_pace', 'mile', 'km', 'kmph', 'mph'], axis=1),
-                points2.drop(['km_pace', 'mile_pace', 'mile', 'km', 'kmph', 'mph'], axis=1),
-                check_like=True, rtol=rtol,
-                check_dtype=check_types
-            )
+            pd.testing.assert_frame_equal(points1, points2, check_like=True, rtol=rtol, check_dtype=check_types)
         else:
-            pd.testing.assert_frame_equal(a1.points, a2.points, check_like=True, check_dtype=check_types)
+            pd.testing.assert_frame_equal(points1, points2, check_like=True, check_dtype=check_types)
 
     def assert_metadata_iterable_equal(self, metadata: Iterable[ActivityMetaData], ids: Collection[int],
                                          ordered: bool = False):
@@ -326,8 +627,13 @@ class BaseTestCase(BaseDataFrameValidateTestCase):
                               ignore_points_cols: Optional[List[str]] = None, check_laps: bool = True,
                               check_elev: bool = True, ignore_laps_cols: Optional[List[str]] = None,
                               check_format: bool = True):
-        for a1, a2 in zip(manager1, manager2):
-            self.assert_activities_equal(a1, a2, almost, check_data_files=check_data_files, check_types=check_types,
+        # Load each manager's activities once, keyed by ID, and check the IDs match before comparing the activities.
+        activities1 = {a.metadata.activity_id: a for a in manager1}
+        activities2 = {a.metadata.activity_id: a for a in manager2}
+        self.assertSetEqual(set(activities1), set(activities2), msg='Managers do not contain the same activity IDs.')
+        ids = sorted(activities1)
+        self.assert_activity_lists_equal([activities1[i] for i in ids], [activities2[i] for i in ids], almost,
+                                         check_data_files=check_data_files, check_types=check_types,
                                          ignore_points_cols=ignore_points_cols, check_laps=check_laps,
                                          check_elev=check_elev, ignore_laps_cols=ignore_laps_cols,
                                          check_format=check_format)
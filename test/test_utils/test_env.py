@@ -1,3 +1,5 @@
+import atexit
+
 from test_utils.test_common import *
 
 """Set up a basic test environment, so that running `python -i test_env.py`
@@ -5,7 +7,10 @@ allows us to explore the data and objects interactively.
 """
 
 TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), 'test_data')
-TEST_RUN_DATA_DIR = run_data_dir('env', replace=True)
+# A fresh, empty data directory, which is removed when the interpreter exits.
+_tmp_run_data_dir = temp_run_data_dir('env')
+atexit.register(_tmp_run_data_dir.cleanup)
+TEST_RUN_DATA_DIR = _tmp_run_data_dir.name
 TEST_CONFIG_FILE = config_file(TEST_RUN_DATA_DIR)
 
 TEST_CONFIG = Config(
@@ -15,6 +20,4 @@ TEST_CONFIG = Config(
     data_dir=TEST_RUN_DATA_DIR,
 )
 
-activity_manager = ActivityManager(TEST_CONFIG)
-for fpath in TEST_GPX_FILES:
-    activity_manager.add_activity_from_file(fpath)
\ No newline at end of file
+activity_manager = get_manager(TEST_CONFIG, TEST_GPX_FILES)
@@ -1,48 +1,62 @@
-from time import time
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
 
-from shyft.geo_utils import norm_length_diff, norm_center_diff, norm_dtw
+from shyft.geo_utils import pairwise_norm_length_diff, pairwise_center_diff, norm_dtw
 from test_utils.test_common import *
 
-TEST_RUN_DATA_DIR = run_data_dir('threshold', replace=True)
-TEST_CONFIG_FILE = config_file(TEST_RUN_DATA_DIR)
+_dtw_points: List[np.ndarray] = []
+
+
+def _init_dtw_worker(points: List[np.ndarray]):
+    global _dtw_points
+    _dtw_points = points
+
+
+def _dtw_pair(pair: Tuple[int, int]) -> Tuple[int, int, float, float]:
+    """Return the indices of the given pair of activities, the DTW
+    distance between them and the time taken to calculate it.
+    """
+    i, j = pair
+    t = perf_counter()
+    d = norm_dtw(_dtw_points[i], _dtw_points[j])
+    return i, j, d, perf_counter() - t
+
 
 def main():
 
     # TODO: Change so that all activities are added to the manager, and then iterate through _activity_elem IDs.
 
-    config = Config(TEST_CONFIG_FILE)
+    # The run data directory is set up here rather than at module level, so that it isn't replaced again whenever
+    # a worker process imports this module.
+    config = Config(config_file(run_data_dir('threshold', replace=True)))
     am = ActivityManager(config)
-    length_df = pd.DataFrame(np.zeros((len(TEST_GPX_FILES), len(TEST_GPX_FILES))))
-    length_t_df = pd.DataFrame(np.zeros((len(TEST_GPX_FILES), len(TEST_GPX_FILES))))
-    center_df = pd.DataFrame(np.zeros((len(TEST_GPX_FILES), len(TEST_GPX_FILES))))
-    center_t_df = pd.DataFrame(np.zeros((len(TEST_GPX_FILES), len(TEST_GPX_FILES))))
-    dtw_df = pd.DataFrame(np.zeros((len(TEST_GPX_FILES), len(TEST_GPX_FILES))))
-    dtw_t_df = pd.DataFrame(np.zeros((len(TEST_GPX_FILES), len(TEST_GPX_FILES))))
-    for i, fpath1 in enumerate(TEST_GPX_FILES):
-        for j, fpath2 in enumerate(TEST_GPX_FILES):
-            id1 = Activity.from_file(fpath1)
-            a2 = Activity.from_file(fpath2)
-            t = time()
-            length_df[i][j] = norm_length_diff(a1.metadata.distance_2d_km, a2.metadata.distance_2d_km)
-            length_t_df[i][j] = time() - t
-            t = time()
-            length_df[j][i] = norm_length_diff(a2.metadata.distance_2d_km, a1.metadata.distance_2d_km)
-            length_t_df[j][i] = time() - t
-            lat2, lon2, _ = a2.metadata.center
-            t = time()
-            center_df[i][j] = norm_center_diff(a1.metadata.center, a2.metadata.center,
-                                               a1.metadata.points_std, a2.metadata.points_std)
-            center_t_df[i][j] = time() - t
-            t = time()
-            center_df[j][i] = norm_center_diff(a2.metadata.center, a1.metadata.center,
-                                               a2.metadata.points_std, a1.metadata.points_std)
-            center_t_df[j][i] = time() - t
-            t = time()
-            dtw_df[i][j] = norm_dtw(a1.points[['latitude', 'longitude']], a2.points[['latitude', 'longitude']])
-            dtw_t_df[i][j] = time() - t
-            t = time()
-            dtw_df[j][i] = norm_dtw(a2.points[['latitude', 'longitude']], a1.points[['latitude', 'longitude']])
-            dtw_t_df[j][i] = time() - t
+    # Load each activity (and extract the data we compare) once, rather than re-parsing both files for every pair.
+    activities = [Activity.from_file(fpath, config, activity_id=i) for i, fpath in enumerate(TEST_GPX_FILES)]
+    dist = np.array([a.metadata.distance_2d_km for a in activities])
+    centers = np.stack([a.metadata.center for a in activities])
+    points = [a.points[['latitude', 'longitude']].to_numpy(dtype=float) for a in activities]
+    # The length and center differences are cheap, so compute (and time) each matrix in one go.
+    t = perf_counter()
+    length_df = pd.DataFrame(pairwise_norm_length_diff(dist))
+    length_t = perf_counter() - t
+    t = perf_counter()
+    center_df = pd.DataFrame(pairwise_center_diff(centers))
+    center_t = perf_counter() - t
+    # DTW distance is symmetric, so only compute the upper triangle (the diagonal, comparing each activity with
+    # itself, is zero). The pairs are independent and CPU-bound, so spread them across processes; the point arrays
+    # are passed to each worker once, when it starts, rather than with every pair.
+    pairs = [(i, j) for i in range(len(activities)) for j in range(i + 1, len(activities))]
+    dtw = np.zeros((len(activities), len(activities)))
+    dtw_t = np.zeros((len(activities), len(activities)))
+    workers = os.cpu_count() or 1
+    t = perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_dtw_worker, initargs=(points,)) as executor:
+        for i, j, d, pair_t in executor.map(_dtw_pair, pairs, chunksize=max(1, len(pairs) // (workers * 4))):
+            dtw[i, j] = dtw[j, i] = d
+            dtw_t[i, j] = dtw_t[j, i] = pair_t
+    dtw_total_t = perf_counter() - t
+    dtw_df = pd.DataFrame(dtw)
+    dtw_t_df = pd.DataFrame(dtw_t)
 
     print('DIFFERENCES')
     print('LENGTH:')
@@ -52,11 +66,10 @@ def main():
     print('DTW:')
     print(dtw_df)
     print('TIMES')
-    print('LENGTH:')
-    print(length_t_df)
-    print('CENTER:')
-    print(center_t_df)
-    print('DTW:')
+    print(f'LENGTH: {length_t}')
+    print(f'CENTER: {center_t}')
+    print(f'DTW (total, wall clock): {dtw_total_t}')
+    print('DTW (per pair):')
     print(dtw_t_df)
 
 if __name__ == '__main__':
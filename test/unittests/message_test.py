@@ -65,10 +65,27 @@ class MessagingTestCase(unittest.TestCase):
 
         # Get only exactly INFO and discard it
         mbus1.get_messages(exact_severity=True, discard_less_severe=False)
-        self.assertListEqual(mbus1._messages, [msg2, msg3])
+        self.assertListEqual(list(mbus1._messages), [msg2, msg3])
 
         mbus2.get_messages(discard_less_severe=True)
-        self.assertListEqual(mbus2._messages, [])
+        self.assertListEqual(list(mbus2._messages), [])
+
+    def test_02_drain_and_limit(self):
+        """Test draining all messages and the limit on the number of messages held."""
+        mbus = MessageBus()
+        with self.assertLogs('shyft.message', level=WARNING) as logs:
+            messages = [mbus.add_message(f'Test message {i}.', severity=DEBUG)
+                        for i in range(MessageBus.MAX_MESSAGES + 5)]
+        # Only the most recent MAX_MESSAGES messages are kept, and each discarded message is logged.
+        self.assertEqual(len(logs.records), 5)
+        self.assertListEqual(mbus.drain(), messages[5:])
+        self.assertListEqual(mbus.drain(), [])
+
+        # Getting (and discarding) messages of every severity for every view is the same as draining.
+        messages = [mbus.add_message(f'Test message {i}.', severity=severity, views={'test_view'})
+                    for i, severity in enumerate((DEBUG, INFO, CRITICAL))]
+        self.assertListEqual(mbus.get_messages(severity=NOTSET), messages)
+        self.assertListEqual(mbus.get_messages(severity=NOTSET), [])
 
 
 
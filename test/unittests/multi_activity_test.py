@@ -1,22 +1,36 @@
 import logging
-from datetime import datetime, date
+from datetime import datetime
 
 from shyft.df_utils.schemas import metadata_time_series_schema
 from shyft.logger import get_logger
 from test.test_utils.test_common import *
 
-logger = get_logger(file_level=logging.DEBUG, console_level=logging.WARN,
+logger = get_logger(file_level=TEST_LOG_LEVEL, console_level=logging.WARN,
                     log_file=os.path.join(TEST_LOGS_DIR, 'multi_activity.log'))
 
+# The tables that shyft creates (leaving out SQLite's internal tables, such as those created by ANALYZE).
+EXPECTED_TABLES = frozenset({'prototypes', 'activities', 'points', 'laps'})
+TABLES_QUERY = "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite%'"
+
+# Dates used by several of the search and time series tests.
+START_2019 = datetime(2019, 1, 1)
+START_2019_DATE = START_2019.date()
+START_2020 = datetime(2020, 1, 1)
+AUGUST_2020 = datetime(2020, 8, 1)
+
 
 class ActivityManagerTestCase(BaseTestCase):
 
     @classmethod
     def setUpClass(cls):
 
-        cls.TEST_RUN_DATA_DIR_1 = run_data_dir('1', replace=True)
-        cls.TEST_RUN_DATA_DIR_2 = run_data_dir('2', replace=True)
-        cls.TEST_RUN_DATA_DIR_3 = run_data_dir('3', replace=True)
+        # Each run gets fresh, empty data directories, which are removed when the tests are finished.
+        cls.TEST_RUN_DATA_TMP_DIRS = [temp_run_data_dir(str(i)) for i in (1, 2, 3)]
+        for tmp_dir in cls.TEST_RUN_DATA_TMP_DIRS:
+            cls.addClassCleanup(tmp_dir.cleanup)
+        cls.TEST_RUN_DATA_DIR_1, cls.TEST_RUN_DATA_DIR_2, cls.TEST_RUN_DATA_DIR_3 = (
+            tmp_dir.name for tmp_dir in cls.TEST_RUN_DATA_TMP_DIRS
+        )
 
         cls.TEST_CONFIG_1 = get_config(cls.TEST_RUN_DATA_DIR_1)
         cls.TEST_CONFIG_2 = get_config(cls.TEST_RUN_DATA_DIR_2)
@@ -30,60 +44,62 @@ class ActivityManagerTestCase(BaseTestCase):
             cls.activities.append(Activity.from_file(fpath, cls.TEST_CONFIG_1, activity_id=i))
         cls.proto_ids = {}
         cls.fpath_ids = {}
+        cls.ids_by_index = []  # The activity IDs of TEST_GPX_FILES, in the same order
         cls.manager_1 = get_manager(cls.TEST_CONFIG_1)  # Add Activities directly (populate in setUp and use as the
                                                             # base for most tests)
         cls.manager_2 = get_manager(cls.TEST_CONFIG_2)  # Add Activities from filepaths
         cls.manager_3 = get_manager(cls.TEST_CONFIG_3)  # Add Activities directly (just to test adding)
 
-        for a in cls.activities:
-            cls.manager_1.add_activity(a)
+        cls.manager_1.add_activities(cls.activities)
+        # manager_1 is only read from after this, so give the query planner statistics about its tables and compact
+        # the database file. VACUUM can't be run inside a transaction, so commit first.
+        cls.manager_1.dbm.sql_execute('ANALYZE')
+        cls.manager_1.dbm.commit()
+        cls.manager_1.dbm.sql_execute('VACUUM')
+        cls._summary = None
 
         # cls.manager_1.dbm.connection.set_trace_callback(print)
 
     @classmethod
-    def tearDownClass(cls):
-        if os.path.exists(cls.TEST_RUN_DATA_DIR_1):
-            shutil.rmtree(cls.TEST_RUN_DATA_DIR_1)
-        if os.path.exists(cls.TEST_RUN_DATA_DIR_2):
-            shutil.rmtree(cls.TEST_RUN_DATA_DIR_2)
-        if os.path.exists(cls.TEST_RUN_DATA_DIR_3):
-            shutil.rmtree(cls.TEST_RUN_DATA_DIR_3)
+    def get_summary(cls) -> pd.DataFrame:
+        """Return the summary of manager_1's metadata, which doesn't
+        change between tests, generating it only the first time.
+        """
+        if cls._summary is None:
+            cls._summary = cls.manager_1.summarize_metadata()
+        return cls._summary
 
     def test_01_setup(self):
         """Perform some basic checks to ensure the test is set up properly."""
 
-        print(self.manager_1.summarize_metadata()['month'])
+        print(self.get_summary()['month'])
         self.assert_manager_valid(self.manager_1)
 
 
         self.assertEqual(len(TEST_GPX_FILES), len(self.activities))
         self.assertEqual(len(TEST_GPX_FILES), len(self.gpx))
-        db1 = self.manager_1.dbm
-        db1.cursor.execute('SELECT name from sqlite_master where type= "table"')
-        tables = {i[0] for i in db1.cursor.fetchall()}
-        self.assertSetEqual(tables, {'prototypes', 'activities', 'points', 'laps'})
-        db2 = self.manager_2.dbm
-        db2.cursor.execute('SELECT name from sqlite_master where type= "table"')
-        self.assertSetEqual({i[0] for i in db2.cursor.fetchall()}, tables)
+        for manager in (self.manager_1, self.manager_2):
+            tables = manager.dbm.cursor.execute(TABLES_QUERY).fetchall()
+            self.assertSetEqual({row[0] for row in tables}, EXPECTED_TABLES)
 
         manager_copy = copy_manager(self.manager_1)
+        self.addCleanup(shutil.rmtree, manager_copy.config.data_dir, ignore_errors=True)
         self.assert_managers_equal(self.manager_1, manager_copy)
 
     def test_02_add_activity(self):
         """Test basic adding of activities."""
 
-        activities = []
-        for i, fpath in enumerate(TEST_GPX_FILES):
-            with open(fpath) as f:
-                self.gpx.append(gpxpy.parse(f))
-            activities.append(Activity.from_file(fpath, self.TEST_CONFIG_3, activity_id=i))
-
+        activities = [Activity.from_file(fpath, self.TEST_CONFIG_3, activity_id=i)
+                      for i, fpath in enumerate(TEST_GPX_FILES)]
 
         for a in activities:
             # print(a.metadata.gpx_file, a.metadata.date_time)
             self.assertIsNotNone(a.metadata.activity_id)
             self.assertIsNone(a.metadata.prototype_id)
-            self.manager_3.add_activity(a)
+
+        # Add all the activities in a single transaction, then check them.
+        self.manager_3.add_activities(activities)
+        for a in activities:
             self.assertIsNotNone(a.metadata.activity_id)
             self.assertIsNotNone(a.metadata.prototype_id)
             self.proto_ids[a.metadata.activity_id] = a.metadata.prototype_id
@@ -97,10 +113,22 @@ class ActivityManagerTestCase(BaseTestCase):
         for fpath in TEST_GPX_FILES:
             _id = self.manager_2.add_activity_from_file(fpath)
             self.fpath_ids[fpath] = _id
-
-        for a1, a2 in zip(self.manager_1, self.manager_2):
-            #print(a1, a2)
-            self.assert_activities_equal(a1, a2)
+            self.ids_by_index.append(_id)
+
+        # Compare the databases in SQLite, only loading and comparing the activities themselves (which gives more
+        # useful failure messages) if they differ.
+        diffs = table_differences(self.manager_1, self.manager_2)
+        if any(diffs.values()):
+            for a1, a2 in zip(self.manager_1, self.manager_2):
+                self.assert_activities_equal(a1, a2)
+            self.fail(f'Databases differ (rows not in both, by table): {diffs}.')
+        # The data files' contents are not in the databases, so compare them separately.
+        pairs = []
+        for _id in self.manager_1.activity_ids:
+            md1 = self.manager_1.get_metadata_by_id(_id)
+            md2 = self.manager_2.get_metadata_by_id(_id)
+            pairs += [(md1.thumbnail_file, md2.thumbnail_file), (md1.gpx_file, md2.gpx_file)]
+        self.assert_file_pairs_equal(pairs)
 
         self.assertSequenceEqual(self.manager_1.prototypes, self.manager_2.prototypes)
 
@@ -109,21 +137,29 @@ class ActivityManagerTestCase(BaseTestCase):
         print(self.fpath_ids)
 
         for i1, i2 in LOOSE_MATCH:
-            id1 = self.fpath_ids[TEST_GPX_FILES[i1]]
-            id2 = self.fpath_ids[TEST_GPX_FILES[i2]]
+            id1 = self.ids_by_index[i1]
+            id2 = self.ids_by_index[i2]
             a1 = self.manager_1.get_activity_by_id(id1)
             a2 = self.manager_1.get_activity_by_id(id2)
-            print(f'a1 {i1} {self.fpath_ids[TEST_GPX_FILES[i1]]} {a1}')
-            print(f'a2 {i2} {self.fpath_ids[TEST_GPX_FILES[i2]]} {a2}')
+            print(f'a1 {i1} {id1} {a1}')
+            print(f'a2 {i2} {id2} {a2}')
             self.assertTrue(self.manager_1.loose_match_routes(a1, a2),
-                            msg=f'{os.path.basename(TEST_GPX_FILES[i1])} and {os.path.basename(TEST_GPX_FILES[i2])}'
+                            msg=f'{TEST_GPX_BASENAMES[i1]} and {TEST_GPX_BASENAMES[i2]}'
                                 ' do not loose match.')
 
+        # The vectorised match matrix (used by test_06) should find the same loose matches, in both directions.
+        activities = [self.manager_1.get_activity_by_id(_id) for _id in self.ids_by_index]
+        loose = loose_match_matrix(self.manager_1, activities)
+        for i1, i2 in LOOSE_MATCH:
+            self.assertTrue(loose[i1, i2] and loose[i2, i1],
+                            msg=f'{TEST_GPX_BASENAMES[i1]} and {TEST_GPX_BASENAMES[i2]} do not loose match in the '
+                                f'match matrix.')
+
     def test_05_test_tight_matching(self):
 
         for i1, i2 in TIGHT_MATCH:
-            id1 = self.fpath_ids[TEST_GPX_FILES[i1]]
-            id2 = self.fpath_ids[TEST_GPX_FILES[i2]]
+            id1 = self.ids_by_index[i1]
+            id2 = self.ids_by_index[i2]
             a1 = self.manager_1.get_activity_by_id(id1)
             a2 = self.manager_1.get_activity_by_id(id2)
             self.assertTrue(self.manager_1.tight_match_routes(a1, a2))
@@ -131,8 +167,8 @@ class ActivityManagerTestCase(BaseTestCase):
         for i1, i2 in LOOSE_MATCH:
             if (i1, i2) in TIGHT_MATCH:
                 continue
-            id1 = self.fpath_ids[TEST_GPX_FILES[i1]]
-            id2 = self.fpath_ids[TEST_GPX_FILES[i2]]
+            id1 = self.ids_by_index[i1]
+            id2 = self.ids_by_index[i2]
             a1 = self.manager_1.get_activity_by_id(id1)
             a2 = self.manager_1.get_activity_by_id(id2)
             self.assertFalse(self.manager_1.tight_match_routes(a1, a2)[0])
@@ -141,52 +177,52 @@ class ActivityManagerTestCase(BaseTestCase):
         """Test that we can determine whether an activity's route is
         unique (ie, does not match any other activity's route).
         """
+        activities = [self.manager_1.get_activity_by_id(_id) for _id in self.ids_by_index]
+        # Compute loose matches between all pairs at once. Tight matching still has to be done pair by pair.
+        loose = loose_match_matrix(self.manager_1, activities)
+        # Tight matching is symmetric, so where both activities are unique, only match each pair once.
+        tight = {}
         for i in UNIQUE:
-            fpath1 = TEST_GPX_FILES[i]
-            id1 = self.fpath_ids[fpath1]
-            a1 = self.manager_1.get_activity_by_id(id1)
-            for fpath2 in TEST_GPX_FILES:
-                id2 = self.fpath_ids[fpath2]
-                a2 = self.manager_1.get_activity_by_id(id2)
-                if fpath1 == fpath2:
-                    self.assertTrue(self.manager_1.loose_match_routes(a1, a2),
-                                    msg=f'{fpath1} is not loose matching itself.')
-                    self.assertTrue(self.manager_1.tight_match_routes(a1, a2)[0],
-                                    msg=f'{fpath1} is not tight matching itself.')
+            name1 = TEST_GPX_BASENAMES[i]
+            for j, name2 in enumerate(TEST_GPX_BASENAMES):
+                pair = (min(i, j), max(i, j))
+                if pair not in tight:
+                    tight[pair] = self.manager_1.tight_match_routes(activities[i], activities[j])[0]
+                if i == j:
+                    self.assertTrue(loose[i, j],
+                                    msg=f'{name1} is not loose matching itself.')
+                    self.assertTrue(tight[pair],
+                                    msg=f'{name1} is not tight matching itself.')
                 else:
-                    self.assertFalse(self.manager_1.loose_match_routes(a1, a2),
-                                     msg=f'{os.path.basename(fpath1)} is loose matching {os.path.basename(fpath2)}.')
-                    self.assertFalse(self.manager_1.tight_match_routes(a1, a2)[0],
-                                     msg=f'{os.path.basename(fpath1)} is tight matching {os.path.basename(fpath2)}.')
+                    self.assertFalse(loose[i, j],
+                                     msg=f'{name1} is loose matching {name2}.')
+                    self.assertFalse(tight[pair],
+                                     msg=f'{name1} is tight matching {name2}.')
 
     def test_07_prototypes(self):
+        # Fetch all the activities' prototype IDs in one query rather than loading each activity repeatedly.
+        proto_of = {md.activity_id: md.prototype_id for md in self.manager_1.search_metadata()}
+
         for i in UNIQUE:
-            fpath1 = TEST_GPX_FILES[i]
-            a1 = self.manager_1.get_activity_by_id(self.fpath_ids[fpath1])
-            self.assertEqual(a1.metadata.activity_id, a1.metadata.prototype_id)
-            for fpath2 in TEST_GPX_FILES:
-                a2 = self.manager_1.get_activity_by_id(self.fpath_ids[fpath2])
-                if fpath1 == fpath2:
-                    self.assertEqual(a1.metadata.prototype_id, a2.metadata.prototype_id)
-                else:
-                    self.assertNotEqual(a1.metadata.prototype_id, a2.metadata.prototype_id)
+            id1 = self.ids_by_index[i]
+            self.assertEqual(id1, proto_of[id1])
+            others = {proto_of[id2] for j, id2 in enumerate(self.ids_by_index) if j != i}
+            self.assertNotIn(proto_of[id1], others)
 
         for i1, i2 in TIGHT_MATCH:
-            id1 = self.fpath_ids[TEST_GPX_FILES[i1]]
-            id2 = self.fpath_ids[TEST_GPX_FILES[i2]]
-            a1 = self.manager_1.get_activity_by_id(id1)
-            a2 = self.manager_1.get_activity_by_id(id2)
-            self.assertEqual(a1.metadata.prototype_id, a2.metadata.prototype_id)
+            id1 = self.ids_by_index[i1]
+            id2 = self.ids_by_index[i2]
+            self.assertEqual(proto_of[id1], proto_of[id2])
 
-        for a in self.manager_1:
-            p = self.manager_1.get_activity_by_id(a.metadata.prototype_id)
-            self.assertTrue(self.manager_1.tight_match_routes(a, p))
+        activities = {a.metadata.activity_id: a for a in list(self.manager_1)}
+        for a in activities.values():
+            self.assertTrue(self.manager_1.tight_match_routes(a, activities[a.metadata.prototype_id]))
 
     def test_08_search(self):
         """Test searching for activities."""
 
         # Test time range matching
-        results = self.manager_1.search_metadata(from_date=datetime(2019, 1, 1), to_date=datetime(2020, 1, 1))
+        results = self.manager_1.search_metadata(from_date=START_2019, to_date=START_2020)
         self.assertSetEqual({a.activity_id for a in results}, set(ACTIVITIES_2019))
 
         # Test prototype matching
@@ -194,16 +230,22 @@ class ActivityManagerTestCase(BaseTestCase):
         self.assertSetEqual({a.activity_id for a in results}, {2, 3})
 
         # Test ID and time range matching
-        results = self.manager_1.search_metadata(from_date=datetime(2019, 1, 1), to_date=datetime(2020, 1, 1),
+        results = self.manager_1.search_metadata(from_date=START_2019, to_date=START_2020,
                                                  ids=[6, 7, 8, 9, 15])
         self.assertSetEqual({a.activity_id for a in results}, {6, 7, 8, 9})
 
     def test_09_thumbnails(self):
+        """Test that re-rendering each activity's thumbnail gives the
+        same image as the one written when the activity was created.
+        """
+        thumbnail_dir = self.TEST_CONFIG_1.thumbnail_dir
+        # Write the new thumbnails elsewhere, so they don't overwrite the ones they are compared with.
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
         for i in self.manager_1.activity_ids:
-            benchmark = os.path.join(self.TEST_RUN_DATA_DIR_1, 'thumbnails', f'{i}.png')
-            fpath = self.manager_1.get_activity_by_id(i).write_thumbnail()
-            with open(fpath, 'rb') as f1, open(benchmark, 'rb') as f2:
-                self.assertEqual(f1.read(), f2.read())
+            benchmark = f'{thumbnail_dir}/{i}.png'
+            fpath = self.manager_1.get_activity_by_id(i).write_thumbnail(os.path.join(tmp_dir.name, f'{i}.png'))
+            self.assert_files_equal(fpath, benchmark)
 
     def test_10_activity_ids(self):
         self.assertEqual(len(TEST_GPX_FILES), len(self.manager_1.activity_ids))
@@ -233,7 +275,7 @@ class ActivityManagerTestCase(BaseTestCase):
 
     def test_13_summarize_activities(self):
 
-        df = self.manager_1.summarize_metadata()
+        df = self.get_summary()
         #print(df)
         print(df.columns)
         print(df.shape)
@@ -260,10 +302,9 @@ class ActivityManagerTestCase(BaseTestCase):
     def test_16_delete(self):
         """Test deleting an activity."""
 
-        # TODO: Operate on copy of manager_1, so that manager_1 is preserved for subsequent tests
-
         reduced_activities = self.activities[:]
-        manager = copy_manager(self.manager_1)
+        manager = snapshot_manager(self.manager_1)
+        self.addCleanup(shutil.rmtree, manager.config.data_dir, ignore_errors=True)
 
         # Test assumptions
         self.assertEqual(manager[3].metadata.prototype_id, 2)
@@ -295,9 +336,8 @@ class ActivityManagerTestCase(BaseTestCase):
         # Try remove an Activity that is not present
         self.assertRaises(ValueError, lambda: self.manager_1.delete_activity(444))
 
-        # Delete all activities.
-        for i in manager.activity_ids:
-            manager.delete_activity(i)
+        # Delete all remaining activities, in a single transaction.
+        manager.delete_activities(manager.activity_ids)
         self.assertListEqual(manager.activity_ids, [])
         self.assertListEqual(manager.all_metadata, [])
         self.assertListEqual(manager.prototypes, [])
@@ -320,27 +360,28 @@ class ActivityManagerTestCase(BaseTestCase):
 
     def test_18_get_month(self):
         """Test getting metadata for all activities in a given month."""
-        results1 = self.manager_1.get_metadata_by_month(datetime(2020, 8, 1))
+        results1 = self.manager_1.get_metadata_by_month(AUGUST_2020)
         self.assert_metadata_iterable_equal(results1, [2, 3])
-        results2 = self.manager_1.get_metadata_by_month(datetime(2020, 8, 1), activity_type='walk')
+        results2 = self.manager_1.get_metadata_by_month(AUGUST_2020, activity_type='walk')
         self.assert_metadata_iterable_equal(results2, [])
-        results3 = self.manager_1.get_metadata_by_month(datetime(2020, 8, 1), activity_type='run')
+        results3 = self.manager_1.get_metadata_by_month(AUGUST_2020, activity_type='run')
         self.assert_metadata_iterable_equal(results3, [2, 3])
 
     def test_19_time_series(self):
         """Test generation of time series data."""
-        weekly = self.manager_1.metadata_weekly_time_series(date(2019, 1, 1))
+        weekly = self.manager_1.metadata_weekly_time_series(START_2019_DATE)
         self.assert_dataframe_valid(weekly, metadata_time_series_schema)
-        weekly_runs = self.manager_1.metadata_weekly_time_series(date(2019, 1, 1), activity_type='run')
+        weekly_runs = self.manager_1.metadata_weekly_time_series(START_2019_DATE, activity_type='run')
         self.assert_dataframe_valid(weekly_runs, metadata_time_series_schema)
-        monthly = self.manager_1.metadata_monthly_time_series(date(2019, 1, 1))
+        monthly = self.manager_1.metadata_monthly_time_series(START_2019_DATE)
         self.assert_dataframe_valid(monthly, metadata_time_series_schema)
-        monthly_runs = self.manager_1.metadata_monthly_time_series(date(2019, 1, 1), activity_type='run')
+        monthly_runs = self.manager_1.metadata_monthly_time_series(START_2019_DATE, activity_type='run')
         self.assert_dataframe_valid(monthly_runs, metadata_time_series_schema)
 
     def test_20_activity_types(self):
         """Test fetching all present activity types."""
-        manager = copy_manager(self.manager_1)
+        manager = snapshot_manager(self.manager_1)
+        self.addCleanup(shutil.rmtree, manager.config.data_dir, ignore_errors=True)
         types = set()
         for a in manager:
             types.add(a.metadata.activity_type)
@@ -353,6 +394,86 @@ class ActivityManagerTestCase(BaseTestCase):
                     manager.delete_activity(a.metadata.activity_id)
             self.assertSetEqual(types, manager.activity_types)
 
+    def test_21_delete_activities(self):
+        """Test deleting several activities at once."""
+        manager = snapshot_manager(self.manager_1)
+        self.addCleanup(shutil.rmtree, manager.config.data_dir, ignore_errors=True)
+        gpx_file = manager.get_metadata_by_id(2).gpx_file
+
+        # Activity 3 should become its own prototype once 2 is deleted; 444 doesn't exist.
+        bad_ids = manager.delete_activities([2, 0, 444])
+        self.assertListEqual(bad_ids, [444])
+        self.assertSetEqual(set(manager.activity_ids), set(self.manager_1.activity_ids) - {0, 2})
+        self.assertEqual(manager[3].metadata.prototype_id, 3)
+        self.assertNotIn(0, manager.prototypes)
+        self.assertNotIn(2, manager.prototypes)
+        self.assertFalse(os.path.exists(gpx_file))
+
+        manager.delete_activities(manager.activity_ids)
+        self.assertListEqual(manager.activity_ids, [])
+        self.assertListEqual(manager.prototypes, [])
+
+    def test_22_query_plans(self):
+        """Test that searching by prototype or by date range uses the
+        relevant index rather than scanning the whole activities table.
+        """
+        db = self.manager_1.dbm
+        queries = (
+            ('SELECT * FROM "activities" WHERE prototype_id = ?', (2,), 'idx_activities_prototype_id'),
+            ('SELECT * FROM "activities" WHERE date_time BETWEEN ? and ?',
+             (START_2019, START_2020), 'idx_activities_date_time_type'),
+            ('SELECT * FROM "activities" WHERE date_time BETWEEN ? and ? AND activity_type = ?',
+             (START_2019, START_2020, 'run'), 'idx_activities_date_time_type')
+        )
+        for query, params, index in queries:
+            with self.subTest(query=query):
+                db.cursor.execute(f'EXPLAIN QUERY PLAN {query}', params)
+                plan = ' '.join(row['detail'] for row in db.cursor.fetchall())
+                self.assertIn(f'USING INDEX {index}', plan)
+                self.assertNotIn('SCAN activities', plan)
+
+    def test_23_add_activities_rollback(self):
+        """Test that if adding one of several activities fails, none of
+        them are added.
+        """
+        manager = snapshot_manager(self.manager_1)
+        self.addCleanup(shutil.rmtree, manager.config.data_dir, ignore_errors=True)
+        ids = manager.activity_ids
+        new_id = manager.get_new_activity_id()
+        activity = Activity.from_file(TEST_GPX_FILES[0], manager.config, activity_id=new_id)
+        # None is not an Activity, so adding it fails after the first activity has been added.
+        self.assertRaises(AttributeError, manager.add_activities, [activity, None])
+        self.assertIsNone(activity.metadata.prototype_id)
+        manager.dbm.commit()
+        self.assertListEqual(manager.activity_ids, ids)
+        self.assertIsNone(manager.get_metadata_by_id(new_id))
+        self.assertRaises(KeyError, lambda: manager[new_id])
+
+    def test_24_metadata_cache(self):
+        """Test that cached metadata is bounded, isn't changed by callers
+        and is invalidated when an activity is saved.
+        """
+        manager = snapshot_manager(self.manager_1)
+        self.addCleanup(shutil.rmtree, manager.config.data_dir, ignore_errors=True)
+        manager.MAX_CACHED_METADATA = 3
+        for _id in manager.activity_ids:
+            manager.get_metadata_by_id(_id)
+        self.assertListEqual(list(manager._metadata_cache), manager.activity_ids[-3:])
+
+        md = manager.get_metadata_by_id(0)
+        md.name = 'Changed by caller'
+        self.assertNotEqual(manager.get_metadata_by_id(0).name, 'Changed by caller')
+        # The same goes for the metadata of an activity in the activity cache.
+        activity = manager.get_activity_by_id(1)
+        md = manager.get_metadata_by_id(1)
+        md.name = 'Changed by caller'
+        self.assertNotEqual(activity.metadata.name, 'Changed by caller')
+
+        activity = manager.get_activity_by_id(0, cache=False)
+        activity.metadata.name = 'Saved'
+        manager.save_activity_to_db(activity)
+        self.assertEqual(manager.get_metadata_by_id(0).name, 'Saved')
+
 
 if __name__ == '__main__':
     unittest.main()
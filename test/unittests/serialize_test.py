@@ -1,4 +1,6 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import lxml.etree
 from shyft.logger import get_logger
@@ -8,55 +10,63 @@ from test_utils.test_common import *
 
 RUN_DIR_BASE = '../../shyft/serialize'
 
-logger = get_logger(file_level=logging.DEBUG, console_level=logging.WARN,
+logger = get_logger(file_level=TEST_LOG_LEVEL, console_level=logging.WARN,
                     log_file=os.path.join(TEST_LOGS_DIR, 'serialize.log'))
 
-# Generate run data directories and config files, etc, for different ActivityManagers
-# - one ActivityManager loads Activities from the Strava GPX files,
-# - one loads Activities from the Garmin .FIT files, and
-# - one loads Activities from the Pyft GPX files.
-
-RUN_DIR_STRAVAGPX = run_data_dir(RUN_DIR_BASE + '_StravaGPX', replace=True)  # For StravaGPX-generated activities
-CONFIG_STRAVAGPX = get_config(RUN_DIR_STRAVAGPX)
+TCX_SCHEMA = os.path.join(TEST_DATA_DIR, 'xml_schemas', 'tcx_v2.xsd')
+GPX_SCHEMA = os.path.join(TEST_DATA_DIR, 'xml_schemas', 'gpx_v1_1.xsd')
 
-RUN_DIR_FIT = run_data_dir(RUN_DIR_BASE + '_FIT', replace=True)  # For .FIT-generated activities
-CONFIG_FIT = get_config(RUN_DIR_FIT)
 
-RUN_DIR_GARMINTCX = run_data_dir(RUN_DIR_BASE + '_GarminTCX', replace=True)  # For Garmin TCX-generated activities
-CONFIG_GARMINTCX = get_config(RUN_DIR_GARMINTCX)
+class SerializeTestCase(BaseTestCase):
 
-RUN_DIR_SHYFTGPX = run_data_dir(RUN_DIR_BASE + '_ShyftGPX', replace=True)  # For Shyft-generated activities
-CONFIG_SHYFTGPX = get_config(RUN_DIR_SHYFTGPX)
+    @classmethod
+    def _init_dirs(cls):
+        """Generate run data directories and config files, etc, for
+        different ActivityManagers:
+        - one ActivityManager loads Activities from the Strava GPX files,
+        - one loads Activities from the Garmin .FIT files,
+        - one loads Activities from the Garmin TCX files,
+        - two load Activities from the GPX and TCX files generated by Shyft, and
+        - one loads Activities from the Runkeeper GPX files.
+
+        This is done here rather than at module level so that simply
+        importing the module (eg, during test discovery) does not wipe
+        and recreate the directories.
+        """
+        cls.RUN_DIR_STRAVAGPX = run_data_dir(RUN_DIR_BASE + '_StravaGPX', replace=True)
+        cls.CONFIG_STRAVAGPX = get_config(cls.RUN_DIR_STRAVAGPX)
 
-RUN_DIR_SHYFTTCX = run_data_dir(RUN_DIR_BASE + '_ShyftTCX', replace=True)  # For Shyft-generated activities
-CONFIG_SHYFTTCX = get_config(RUN_DIR_SHYFTTCX)
+        cls.RUN_DIR_FIT = run_data_dir(RUN_DIR_BASE + '_FIT', replace=True)
+        cls.CONFIG_FIT = get_config(cls.RUN_DIR_FIT)
 
-RUN_DIR_RKGPX = run_data_dir(RUN_DIR_BASE + '_RKGPX', replace=True)  # For Runkeeper-generated activities
-CONFIG_RKGPX = get_config(RUN_DIR_RKGPX)
+        cls.RUN_DIR_GARMINTCX = run_data_dir(RUN_DIR_BASE + '_GarminTCX', replace=True)
+        cls.CONFIG_GARMINTCX = get_config(cls.RUN_DIR_GARMINTCX)
 
-NEW_GPX_DIR = os.path.join(RUN_DIR_SHYFTGPX, 'generated_gpx')
-if not os.path.exists(NEW_GPX_DIR):
-    os.makedirs(NEW_GPX_DIR)
+        cls.RUN_DIR_SHYFTGPX = run_data_dir(RUN_DIR_BASE + '_ShyftGPX', replace=True)
+        cls.CONFIG_SHYFTGPX = get_config(cls.RUN_DIR_SHYFTGPX)
 
-NEW_TCX_DIR = os.path.join(RUN_DIR_SHYFTTCX, 'generated_tcx')
-if not os.path.exists(NEW_TCX_DIR):
-    os.makedirs(NEW_TCX_DIR)
+        cls.RUN_DIR_SHYFTTCX = run_data_dir(RUN_DIR_BASE + '_ShyftTCX', replace=True)
+        cls.CONFIG_SHYFTTCX = get_config(cls.RUN_DIR_SHYFTTCX)
 
-TCX_SCHEMA = os.path.join(TEST_DATA_DIR, 'xml_schemas', 'tcx_v2.xsd')
-GPX_SCHEMA = os.path.join(TEST_DATA_DIR, 'xml_schemas', 'gpx_v1_1.xsd')
+        cls.RUN_DIR_RKGPX = run_data_dir(RUN_DIR_BASE + '_RKGPX', replace=True)
+        cls.CONFIG_RKGPX = get_config(cls.RUN_DIR_RKGPX)
 
+        cls.NEW_GPX_DIR = os.path.join(cls.RUN_DIR_SHYFTGPX, 'generated_gpx')
+        os.makedirs(cls.NEW_GPX_DIR, exist_ok=True)
 
-class SerializeTestCase(BaseTestCase):
+        cls.NEW_TCX_DIR = os.path.join(cls.RUN_DIR_SHYFTTCX, 'generated_tcx')
+        os.makedirs(cls.NEW_TCX_DIR, exist_ok=True)
 
     @classmethod
     def setUpClass(cls):
-        cls.manager_stravagpx = get_manager(CONFIG_STRAVAGPX, files=TEST_GPX_FILES_2)
-        cls.manager_fit = get_manager(CONFIG_FIT, files=TEST_FIT_FILES)
-        cls.manager_garmintcx = get_manager(CONFIG_GARMINTCX, files=TEST_TCX_FILES)
-        cls.strava_gpx = []
-        for i, fpath in enumerate(TEST_GPX_FILES_2):
-            with open(fpath) as f:
-                cls.strava_gpx.append(gpxpy.parse(f))
+        cls._init_dirs()
+        cls.manager_stravagpx = get_manager(cls.CONFIG_STRAVAGPX, files=TEST_GPX_FILES_2)
+        cls.manager_fit = get_manager(cls.CONFIG_FIT, files=TEST_FIT_FILES)
+        cls.manager_garmintcx = get_manager(cls.CONFIG_GARMINTCX, files=TEST_TCX_FILES)
+        cls.strava_lengths = [gpx_length_2d(fpath) for fpath in TEST_GPX_FILES_2]
+        # Compile the XML schemas once, rather than once per test.
+        cls.gpx_schema = lxml.etree.XMLSchema(file=GPX_SCHEMA)
+        cls.tcx_schema = lxml.etree.XMLSchema(file=TCX_SCHEMA)
         #print(cls.manager_stravagpx.activity_ids)
 
     #@classmethod
@@ -70,13 +80,13 @@ class SerializeTestCase(BaseTestCase):
         initialising and parsing a file.
         """
         for gpx_file in TEST_GPX_FILES_2:
-            parser = parser_factory(gpx_file, CONFIG_STRAVAGPX)
+            parser = parser_factory(gpx_file, self.CONFIG_STRAVAGPX)
             self.assertIsInstance(parser, BaseGPXParser)
         for fit_file in TEST_FIT_FILES:
-            parser = parser_factory(os.path.join(TEST_FIT_FILES_DIR, fit_file), CONFIG_FIT)
+            parser = parser_factory(os.path.join(TEST_FIT_FILES_DIR, fit_file), self.CONFIG_FIT)
             self.assertIsInstance(parser, FITParser)
         for tcx_file in TEST_TCX_FILES:
-            parser = parser_factory(os.path.join(TEST_TCX_FILES_DIR, tcx_file), CONFIG_GARMINTCX)
+            parser = parser_factory(os.path.join(TEST_TCX_FILES_DIR, tcx_file), self.CONFIG_GARMINTCX)
             self.assertIsInstance(parser, TCXParser)
 
     def test_02_source(self):
@@ -88,16 +98,37 @@ class SerializeTestCase(BaseTestCase):
         for activity in self.manager_fit:
             self.assertEqual(activity.metadata.source_format, 'fit')
 
+    def _write_and_validate(self, activities: List[Activity], out_dir: str, fmt: str,
+                            schema: lxml.etree.XMLSchema) -> List[str]:
+        """Write each of `activities` to a file of the given format ('gpx'
+        or 'tcx') in `out_dir` and validate the file against `schema`.
+
+        Files are written and validated concurrently, as each is
+        independent. Returns the paths to the new files.
+        """
+
+        # lxml parsers should not be shared between threads, so each worker thread reuses its own parser for all the
+        # files it handles.
+        local = threading.local()
+
+        def _write(activity: Activity) -> str:
+            fpath = os.path.join(out_dir, f'{activity.metadata.activity_id}.{fmt}')
+            getattr(activity, f'to_{fmt}_file')(fpath)
+            if not hasattr(local, 'parser'):
+                local.parser = lxml.etree.XMLParser(schema=schema)
+            # Validate while parsing, rather than walking the parsed tree a second time.
+            # Raises an XMLSyntaxError if the file is not valid.
+            lxml.etree.parse(fpath, local.parser)
+            return fpath
+
+        with ThreadPoolExecutor() as executor:
+            return list(executor.map(_write, activities))
+
     def test_03_create_gpx(self):
         """Test that we can create GPX files and load those files again."""
-        manager_pyftgpx = get_manager(CONFIG_SHYFTGPX)
-        validator = lxml.etree.XMLSchema(file=GPX_SCHEMA)
-        for activity in self.manager_stravagpx:
-            activity_id = activity.metadata.activity_id
-            #print(f'_activity_elem: {activity_id}')
-            fpath = os.path.join(NEW_GPX_DIR, f'{activity_id}.gpx')
-            activity.to_gpx_file(fpath)
-            validator.assert_(lxml.etree.parse(fpath))
+        manager_pyftgpx = get_manager(self.CONFIG_SHYFTGPX)
+        # ActivityManager is only accessed from this thread, so add the files serially once they are written.
+        for fpath in self._write_and_validate(list(self.manager_stravagpx), self.NEW_GPX_DIR, 'gpx', self.gpx_schema):
             id_ = manager_pyftgpx.add_activity_from_file(fpath)
             new_activity = manager_pyftgpx[id_]
             self.assertEqual(new_activity.metadata.source_format, 'gpx')
@@ -106,13 +137,8 @@ class SerializeTestCase(BaseTestCase):
 
     def test_04_create_tcx(self):
         """Test that we can create TCX files and load those files again.."""
-        manager_pyfttcx = get_manager(CONFIG_SHYFTTCX)
-        validator = lxml.etree.XMLSchema(file=TCX_SCHEMA)
-        for activity in self.manager_garmintcx:
-            activity_id = activity.metadata.activity_id
-            fpath = os.path.join(NEW_TCX_DIR, f'{activity_id}.tcx')
-            activity.to_tcx_file(fpath)
-            validator.assert_(lxml.etree.parse(fpath))
+        manager_pyfttcx = get_manager(self.CONFIG_SHYFTTCX)
+        for fpath in self._write_and_validate(list(self.manager_garmintcx), self.NEW_TCX_DIR, 'tcx', self.tcx_schema):
             id_ = manager_pyfttcx.add_activity_from_file(fpath)
             new_activity = manager_pyfttcx[id_]
             self.assertEqual(new_activity.metadata.source_format, 'tcx')
@@ -123,19 +149,17 @@ class SerializeTestCase(BaseTestCase):
         """Test that the Activity generated from the GPX file and the
         FIT file are (roughly) equivalent.
         """
-        _id = 0
-        for g, f in zip(TEST_GPX_FILES_2, TEST_FIT_FILES):
-            gpx_activity = Activity.from_file(g, CONFIG_STRAVAGPX, activity_id=_id)
-            fit_activity = Activity.from_file(f, CONFIG_FIT, activity_id=_id)
-            self.assert_activities_equal(
-                gpx_activity,
-                fit_activity,
-                almost=True,
-                check_data_files=False,
-                check_laps=False,
-                check_format=False,
-            )
-            _id += 1
+        # Reuse the activities already parsed in setUpClass; both managers were given the files in the same order,
+        # so the activity IDs correspond. Each manager assigns prototypes by its own route matching, which should
+        # find the same matches for equivalent activities, so prototypes are compared too (as in test_06).
+        self.assert_activity_lists_equal(
+            list(self.manager_stravagpx),
+            list(self.manager_fit),
+            almost=True,
+            check_data_files=False,
+            check_laps=False,
+            check_format=False,
+        )
 
     def test_06_fit_tcx_parser_equal(self):
         """Test that the Activity generated from the TCX file and the
@@ -144,7 +168,7 @@ class SerializeTestCase(BaseTestCase):
         # TCX doesn't have have lap average speed, even though FIT does.
         ignore_laps_cols = ['mean_kmph']
         for tcx_activity, fit_activity in zip(self.manager_garmintcx, self.manager_fit):
-            if tcx_activity.metadata.activity_type == CONFIG_GARMINTCX.default_activity_type:
+            if tcx_activity.metadata.activity_type == self.CONFIG_GARMINTCX.default_activity_type:
                 # For some reason, Garmin-generated TCX files for non-running activities do not include cadence for me,
                 # even though the associated FIT file does.
                 ignore_points_cols = ['cadence']
@@ -163,34 +187,45 @@ class SerializeTestCase(BaseTestCase):
 
     def test_07_source_save(self):
         """Test that source files are properly saved."""
-        for activity, gpx_file in zip(self.manager_stravagpx, TEST_GPX_FILES_2):
-            self.assert_files_equal(activity.metadata.source_file, gpx_file)
-        manager_fit = get_manager(CONFIG_FIT, TEST_FIT_FILES)
-        for activity, fit_file in zip(manager_fit, TEST_FIT_FILES):
-            self.assert_files_equal(activity.metadata.source_file, fit_file)
+        self.assert_file_pairs_equal((activity.metadata.source_file, gpx_file)
+                                     for activity, gpx_file in zip(self.manager_stravagpx, TEST_GPX_FILES_2))
+        manager_fit = get_manager(self.CONFIG_FIT, TEST_FIT_FILES)
+        self.assert_file_pairs_equal((activity.metadata.source_file, fit_file)
+                                     for activity, fit_file in zip(manager_fit, TEST_FIT_FILES))
 
     def test_08_gpx_length(self):
         """Test that the length we calculate for activities generated
-        from GPX files is the same as the length calculated by gpxpy.
-        There is some tolerance of small discrepancies as there may be
-        rounding differences.
+        from GPX files is the same as the length calculated by gpxpy
+        (see `gpx_length_2d`). There is some tolerance of small
+        discrepancies as there may be rounding differences.
         """
-        for activity, gpx in zip(self.manager_stravagpx, self.strava_gpx):
-            self.assertAlmostEqual(activity.metadata.distance_2d_km * 1000, gpx.length_2d(), places=3)
+        for activity, length in zip(self.manager_stravagpx, self.strava_lengths):
+            self.assertAlmostEqual(activity.metadata.distance_2d_km * 1000, length, places=3)
 
     def test_09_laps(self):
         """Test that laps have been created correctly."""
         for activity in self.manager_stravagpx:
             self.assertIsNone(activity.laps)
-        for activity in self.manager_fit:
-            laps = activity.laps
-            self.assertIsInstance(laps, pd.DataFrame)
-            self.assertAlmostEqual(laps['distance'].sum(), activity.metadata.distance_2d_km * 1000, places=3)
-            self.assertAlmostEqual(laps['duration'].sum(), activity.metadata.duration)
+        activities = list(self.manager_fit)
+        for activity in activities:
+            self.assertIsInstance(activity.laps, pd.DataFrame)
+        all_laps = pd.concat({a.metadata.activity_id: a.laps for a in activities}, names=['activity_id', 'lap'])
+        totals = all_laps.groupby(level='activity_id')[['distance', 'duration']].sum()
+        ids = [a.metadata.activity_id for a in activities]
+        # Equivalent to assertAlmostEqual(..., places=3) for each activity
+        np.testing.assert_allclose(
+            totals.loc[ids, 'distance'].to_numpy(),
+            [a.metadata.distance_2d_km * 1000 for a in activities],
+            rtol=0, atol=5e-4
+        )
+        np.testing.assert_array_equal(
+            totals.loc[ids, 'duration'].to_numpy(),
+            np.array([a.metadata.duration for a in activities], dtype='timedelta64[ns]')
+        )
 
     def test_10_rk_gpx(self):
         """Test parsing of GPX files generated by Runkeeper."""
-        manager_rkgpx = get_manager(CONFIG_RKGPX, files=RK_GPX_FILES)
+        manager_rkgpx = get_manager(self.CONFIG_RKGPX, files=RK_GPX_FILES)
         for strava_activity, rk_activity in zip(self.manager_stravagpx, manager_rkgpx):
             #print(f'testing {rk_activity.metadata.source_file}')
             self.assertEqual(rk_activity.metadata.source_format, 'gpx')